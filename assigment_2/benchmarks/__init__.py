@@ -0,0 +1,35 @@
+"""
+Standalone benchmarks for the warehouse API.
+
+Run them from `assigment_2`, e.g. `python -m benchmarks.serializers`.
+Each benchmark works on a throwaway test database, never on `db.sqlite3`.
+"""
+import os
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django(settings_module='core.settings'):
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database(verbosity=0):
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=verbosity, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        teardown_test_environment()
@@ -0,0 +1,68 @@
+"""
+Latency of the `/api/analytics/` endpoints against a long movement history.
+
+    python -m benchmarks.analytics --orders 50000 --years 1 4
+
+The same one-month window is queried on a history of one and of several
+years: with the date index the time follows the rows in the window, not the
+size of the ledger. The last query covers the whole history for comparison.
+"""
+import argparse
+import statistics
+import time
+from datetime import date
+
+from . import setup_django, test_database
+
+QUERIES = [
+    ('items', {'start_date': '2024-03-01', 'end_date': '2024-03-31'}),
+    ('items', {'start_date': '2024-03-01', 'end_date': '2024-03-31', 'ordering': '-sold_qty', 'offset': 500}),
+    ('monthly', {'start_date': '2024-03-01', 'end_date': '2024-03-31'}),
+    ('top', {'start_date': '2024-03-01', 'end_date': '2024-03-31', 'top': 5}),
+    ('monthly', {}),
+]
+
+
+def flush():
+    from warehouse.models import ChangeLog, Item, PurchaseDetail, PurchaseHeader, SellDetail, SellHeader, StockMovement
+
+    for model in (ChangeLog, StockMovement, SellDetail, PurchaseDetail, SellHeader, PurchaseHeader, Item):
+        model.objects.all().delete()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--orders', type=int, default=50000, help='Orders per year of history.')
+    parser.add_argument('--years', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test import Client
+    from warehouse.generator import DatasetGenerator
+    from warehouse.models import StockMovement
+
+    with test_database():
+        for years in args.years:
+            flush()
+            started = time.perf_counter()
+            DatasetGenerator(items=args.items, orders=args.orders * years, start_date=date(2024, 1, 1),
+                             days=365 * years, batch_size=5000).run()
+            print(f'{years} year(s): {StockMovement.objects.count():,} movements in '
+                  f'{time.perf_counter() - started:.1f}s')
+
+            client = Client()
+            for path, params in QUERIES:
+                timings = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    response = client.get(f'/api/analytics/{path}/', params)
+                    timings.append((time.perf_counter() - started) * 1000)
+                    assert response.status_code == 200, response.content
+                label = ' '.join(f'{key}={value}' for key, value in params.items()) or 'all dates'
+                print(f'  {path:<8} {label:<70} p50 {statistics.median(timings):8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
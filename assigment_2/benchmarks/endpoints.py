@@ -0,0 +1,125 @@
+"""
+Load benchmark for the warehouse endpoints at increasing dataset sizes.
+
+    python -m benchmarks.endpoints --scales 1000 10000 50000 --output bench.json
+
+For every scale a fresh dataset is generated, then `/items/`, `/purchase/`,
+`/sell/` and `/report/<code>/` are requested through the test client. The
+p50/p95/p99 latency and the query counts per endpoint are written as JSON.
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from . import setup_django, test_database
+
+ENDPOINTS = ['items', 'purchase', 'sell', 'report']
+
+
+def percentiles(samples):
+    if len(samples) < 2:
+        value = samples[0] if samples else 0.0
+        return value, value, value
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return cuts[49], cuts[94], cuts[98]
+
+
+def run_endpoint(client, urls, requests):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    latencies = []
+    queries = []
+    for n in range(requests):
+        url = urls[n % len(urls)]
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = client.get(url, HTTP_ACCEPT='application/json')
+            latencies.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, f'{url} returned {response.status_code}'
+        queries.append(len(captured))
+
+    p50, p95, p99 = percentiles(latencies)
+    return {
+        'requests': requests,
+        'p50_ms': round(p50, 3),
+        'p95_ms': round(p95, 3),
+        'p99_ms': round(p99, 3),
+        'max_ms': round(max(latencies), 3),
+        'queries_min': min(queries),
+        'queries_max': max(queries),
+        'queries_mean': round(statistics.fmean(queries), 2),
+        'bytes': len(response.content),
+    }
+
+
+def run_scale(orders, args):
+    from django.test import Client
+    from warehouse.generator import DatasetGenerator
+    from warehouse.models import ChangeLog, Item, PurchaseHeader, PurchaseDetail, SellHeader, SellDetail, StockMovement
+
+    for model in (ChangeLog, StockMovement, SellDetail, PurchaseDetail, SellHeader, PurchaseHeader, Item):
+        model.objects.all().delete()
+
+    items = args.items or max(orders // 10, 10)
+    started = time.perf_counter()
+    written = DatasetGenerator(items=items, orders=orders, lines=args.lines,
+                               days=args.days, seed=args.seed).run()
+    generated = time.perf_counter() - started
+
+    rng = random.Random(args.seed)
+    report_urls = [
+        f'/api/report/{DatasetGenerator.item_code(rng.randrange(items))}/'
+        for _ in range(args.requests)
+    ]
+    urls = {
+        'items': ['/api/items/'],
+        'purchase': ['/api/purchase/'],
+        'sell': ['/api/sell/'],
+        'report': report_urls,
+    }
+
+    client = Client()
+    result = {
+        'orders': orders,
+        'rows': {model.__name__: count for model, count in written.items()},
+        'generate_seconds': round(generated, 3),
+        'endpoints': {},
+    }
+    for name in args.endpoints:
+        # One warm-up request so URL resolution and imports are not measured.
+        client.get(urls[name][0], HTTP_ACCEPT='application/json')
+        result['endpoints'][name] = stats = run_endpoint(client, urls[name], args.requests)
+        print(f'{orders:>9} orders  {name:<9} p50 {stats["p50_ms"]:9.2f} ms  '
+              f'p95 {stats["p95_ms"]:9.2f} ms  p99 {stats["p99_ms"]:9.2f} ms  '
+              f'queries {stats["queries_max"]}')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--scales', type=int, nargs='+', default=[100, 1000, 10000],
+                        help='Number of orders to generate for each run.')
+    parser.add_argument('--items', type=int, default=None, help='Defaults to orders / 10.')
+    parser.add_argument('--lines', type=int, default=3)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--requests', type=int, default=20, help='Requests per endpoint and scale.')
+    parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=ENDPOINTS)
+    parser.add_argument('--output', default='bench_endpoints.json')
+    args = parser.parse_args()
+
+    setup_django()
+
+    with test_database():
+        results = [run_scale(orders, args) for orders in args.scales]
+
+    with open(args.output, 'w') as f:
+        json.dump({'scales': results}, f, indent=2)
+    print(f'Wrote {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Latency of `/api/items/search/` against a large item table.
+
+    python -m benchmarks.search --items 1000000
+
+Items get two to four words from a fixed vocabulary as name and
+description, so queries range from rare words to prefixes that match a
+large share of the table.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from . import setup_django, test_database
+
+WORDS = [
+    'steel', 'bolt', 'washer', 'bracket', 'hinge', 'copper', 'pipe', 'valve', 'gasket', 'cable',
+    'switch', 'relay', 'fuse', 'motor', 'pump', 'filter', 'bearing', 'spring', 'clamp', 'rivet',
+    'panel', 'sensor', 'module', 'adapter', 'socket', 'plug', 'drill', 'blade', 'saw', 'glue',
+]
+QUERIES = ['gasket', 'gas', 'steel bolt', 'st', 'copper pipe valve', 'zzz']
+
+
+def populate(items, seed):
+    from warehouse.models import Item
+
+    rng = random.Random(seed)
+    batch = []
+    for n in range(items):
+        name = ' '.join(rng.sample(WORDS, rng.randint(2, 4)))
+        description = ' '.join(rng.sample(WORDS, rng.randint(2, 4)))
+        batch.append(Item(code=f'ITEM{n:07d}', name=name.title(), unit='pcs', description=description,
+                          is_deleted=n % 50 == 0))
+        if len(batch) == 5000:
+            Item.objects.bulk_create(batch)
+            batch = []
+    Item.objects.bulk_create(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--items', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test import Client
+
+    with test_database():
+        started = time.perf_counter()
+        populate(args.items, args.seed)
+        print(f'{args.items:,} items indexed in {time.perf_counter() - started:.1f}s')
+
+        client = Client()
+        for query in QUERIES:
+            for offset in (0, 200):
+                timings = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    response = client.get('/api/items/search/', {'q': query, 'offset': offset})
+                    timings.append((time.perf_counter() - started) * 1000)
+                    assert response.status_code == 200, response.content
+                hits = len(response.json()['results'])
+                print(f'q={query!r:<22} offset={offset:<4} {hits:3} hits  '
+                      f'p50 {statistics.median(timings):7.1f} ms  max {max(timings):7.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
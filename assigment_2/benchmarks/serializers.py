@@ -0,0 +1,94 @@
+"""
+Compare rows/sec of the DRF serializers against the `values_list()` row
+encoders used by the fast read mode.
+
+    python -m benchmarks.serializers --items 20000 --orders 5000
+"""
+import argparse
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from . import setup_django, test_database
+
+
+def populate(items, orders, lines):
+    from warehouse.models import Item, PurchaseHeader, PurchaseDetail, SellHeader, SellDetail
+
+    Item.objects.bulk_create([
+        Item(code=f'ITEM{i:06d}', name=f'Product {i}', unit='pcs', description=f'Item {i}',
+             stock=Decimal('100.00'), balance=Decimal('1500.50'))
+        for i in range(items)
+    ], batch_size=1000)
+
+    start = date(2024, 1, 1)
+    for header_model, detail_model, prefix in (
+        (PurchaseHeader, PurchaseDetail, 'PO'),
+        (SellHeader, SellDetail, 'SO'),
+    ):
+        header_model.objects.bulk_create([
+            header_model(code=f'{prefix}{n:06d}', date=start + timedelta(days=n % 365),
+                         description=f'Order {n}')
+            for n in range(orders)
+        ], batch_size=1000)
+
+        details = []
+        for n in range(orders):
+            for line in range(lines):
+                detail = detail_model(
+                    header_id=f'{prefix}{n:06d}',
+                    item_id=f'ITEM{(n * lines + line) % items:06d}',
+                    quantity=Decimal('5.00'),
+                )
+                if detail_model is PurchaseDetail:
+                    detail.unit_price = Decimal('12.25')
+                    detail.remaining_quantity = Decimal('5.00')
+                details.append(detail)
+        detail_model.objects.bulk_create(details, batch_size=1000)
+
+
+def measure(label, rows, func, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print(f'  {label:<12} {best * 1000:9.1f} ms  {rows / best:12,.0f} rows/s')
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--items', type=int, default=20000)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--lines', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from rest_framework.renderers import JSONRenderer
+    from warehouse.encoders import row_encoder
+    from warehouse.models import Item, PurchaseHeader, SellHeader
+    from warehouse.serializers import ItemSerializer, PurchaseHeaderSerializer, SellHeaderSerializer
+
+    with test_database():
+        populate(args.items, args.orders, args.lines)
+
+        for serializer_class, queryset in (
+            (ItemSerializer, Item.objects.filter(is_deleted=False)),
+            (PurchaseHeaderSerializer, PurchaseHeader.objects.filter(is_deleted=False)),
+            (SellHeaderSerializer, SellHeader.objects.filter(is_deleted=False)),
+        ):
+            rows = queryset.count()
+            print(f'{serializer_class.__name__} ({rows} rows)')
+            expected = measure('serializer', rows,
+                               lambda: serializer_class(queryset.all(), many=True).data, args.repeat)
+            fast = measure('row encoder', rows,
+                           lambda: row_encoder(serializer_class).encode(queryset.all()), args.repeat)
+            assert JSONRenderer().render(expected) == JSONRenderer().render(fast), 'output differs'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+Concurrent write benchmark for the SQLite profiles.
+
+    python -m benchmarks.sqlite_writes --threads 8 --writes 200
+
+Every writer thread posts purchase and sell lines through `add_detail`
+against a fresh database file while reader threads fetch an item. Each profile runs in its own process:
+`core.settings` on the stock Django SQLite backend, the same with only
+`BEGIN IMMEDIATE` transactions from `core.backends.sqlite3`, and
+`core.settings_production`.
+The throughput and the number of failed writes are compared.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from . import BASE_DIR
+
+# Settings module and overrides of DATABASES['default'] for each profile.
+PROFILES = {
+    'stock': ('core.settings', {}),
+    'immediate': ('core.settings', {'ENGINE': 'core.backends.sqlite3', 'OPTIONS': {'transaction_mode': 'IMMEDIATE'}}),
+    'production': ('core.settings_production', {}),
+}
+
+
+def run_profile(profile, path, threads, writes, readers):
+    settings_module, overrides = PROFILES[profile]
+    os.environ['DJANGO_SETTINGS_MODULE'] = settings_module
+    from django.conf import settings
+    settings.DATABASES['default'].update(overrides, NAME=path)
+
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    from django.db import connections
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from warehouse.models import Item, PurchaseHeader, SellHeader
+
+    setup_test_environment()
+    call_command('migrate', verbosity=0)
+    Item.objects.bulk_create([Item(code=f'ITEM{n:03d}', name=f'Item {n}', unit='pcs') for n in range(threads)])
+    PurchaseHeader.objects.create(code='PO001')
+    SellHeader.objects.create(code='SO001')
+    connections.close_all()
+
+    results = {'ok': 0, 'failed': 0, 'reads': 0, 'errors': {}}
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads + readers)
+    writing = threading.Event()
+    writing.set()
+
+    def worker(n):
+        client = Client()
+        item = f'ITEM{n:03d}'
+        barrier.wait()
+        for i in range(writes):
+            if i % 2 == 0:
+                url, data = '/api/purchase/PO001/add_detail/', {'item': item, 'quantity': '2', 'unit_price': '10'}
+            else:
+                url, data = '/api/sell/SO001/add_detail/', {'item': item, 'quantity': '1'}
+            try:
+                response = client.post(url, data, content_type='application/json')
+                ok = response.status_code == 201
+                error = None if ok else f'HTTP {response.status_code}'
+            except Exception as exc:
+                ok, error = False, f'{type(exc).__name__}: {exc}'
+            with lock:
+                if ok:
+                    results['ok'] += 1
+                else:
+                    results['failed'] += 1
+                    results['errors'][error] = results['errors'].get(error, 0) + 1
+        connections.close_all()
+
+    def reader():
+        client = Client()
+        barrier.wait()
+        while writing.is_set():
+            try:
+                status = client.get('/api/items/ITEM000/').status_code
+                ok, error = status == 200, f'HTTP {status}'
+            except Exception as exc:
+                ok, error = False, f'{type(exc).__name__}: {exc}'
+            with lock:
+                if ok:
+                    results['reads'] += 1
+                else:
+                    results['errors'][error] = results['errors'].get(error, 0) + 1
+        connections.close_all()
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    background = [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in workers + background:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    writing.clear()
+    for thread in background:
+        thread.join()
+
+    results['seconds'] = round(elapsed, 3)
+    results['writes_per_second'] = round(results['ok'] / elapsed, 1)
+    results['reads_per_second'] = round(results['reads'] / elapsed, 1)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--writes', type=int, default=200, help='Writes per thread.')
+    parser.add_argument('--readers', type=int, default=4, help='Threads reading items while writes run.')
+    parser.add_argument('--profile', choices=PROFILES, help='Run a single profile in this process.')
+    args = parser.parse_args()
+
+    if args.profile:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.sqlite3')
+            result = run_profile(args.profile, path, args.threads, args.writes, args.readers)
+        print(json.dumps(result))
+        return
+
+    for profile in PROFILES:
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.sqlite_writes', '--profile', profile,
+             '--threads', str(args.threads), '--writes', str(args.writes), '--readers', str(args.readers)],
+            cwd=BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f'{profile:<11} {result["writes_per_second"]:8.1f} writes/s  '
+              f'{result["reads_per_second"]:8.1f} reads/s  '
+              f'ok {result["ok"]:6}  failed {result["failed"]:6}  {result["seconds"]:.1f}s')
+        for error, count in sorted(result['errors'].items(), key=lambda item: -item[1])[:3]:
+            print(f'{"":11} {count:6} x {error[:100]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Cold-start benchmark for the settings profiles.
+
+    python -m benchmarks.startup --runs 10 --output bench_startup.json
+
+Every boot runs in a fresh interpreter, once per settings profile:
+
+- `setup`: `django.setup()`, paid by every `manage.py` command.
+- `worker`: the WSGI application with its middleware and the URLconf with
+  every view loaded, what a web worker does before its first request.
+
+The median and fastest wall time of the process and the number of modules
+loaded are reported. One more boot of each runs under `-X importtime` to
+report the time spent importing and the packages that took longest during
+a worker boot.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+from . import BASE_DIR
+
+PROFILES = {
+    'full': 'core.settings',
+    'api': 'core.settings_api',
+}
+
+BOOTS = {
+    'setup': 'import django; django.setup()',
+    'worker': (
+        'from django.core.wsgi import get_wsgi_application; get_wsgi_application(); '
+        'from django.urls import get_resolver; get_resolver().url_patterns'
+    ),
+}
+
+REPORT_CODE = 'import json, sys; print(json.dumps({"modules": len(sys.modules)}))'
+
+
+def parse_importtime(output):
+    """Return `(module, self us, cumulative us, depth)` for every `-X importtime` line."""
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        imports.append((name.strip(), int(own), int(cumulative), depth))
+    return imports
+
+
+def package_times(imports):
+    """Import time in microseconds per top level package, own time only."""
+    times = Counter()
+    for module, own, _, _ in imports:
+        times[module.split('.')[0]] += own
+    return times
+
+
+def boot(profile, name, importtime=False):
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=PROFILES[profile])
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', f'{BOOTS[name]}; {REPORT_CODE}']
+    started = time.perf_counter()
+    result = subprocess.run(command, cwd=BASE_DIR, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if result.returncode:
+        raise SystemExit(f'{profile} {name} failed:\n{result.stderr[-2000:]}')
+    return elapsed, json.loads(result.stdout.strip().splitlines()[-1])['modules'], result.stderr
+
+
+def run(profiles, runs):
+    """
+    Time `runs` plain boots of every profile, interleaved so that a busy
+    machine slows all of them alike, then one boot under `-X importtime`
+    for the import report. `-X importtime` itself adds to the boot time.
+    """
+    samples = {(profile, name): [] for profile in profiles for name in BOOTS}
+    for key in samples:
+        boot(*key)  # Writes the bytecode caches.
+    for _ in range(runs):
+        for key in samples:
+            samples[key].append(boot(*key)[0])
+
+    results = {}
+    for (profile, name), seconds in samples.items():
+        _, modules, log = boot(profile, name, importtime=True)
+        imports = parse_importtime(log)
+        results.setdefault(profile, {})[name] = {
+            'wall_ms': {
+                'median': round(statistics.median(seconds) * 1000, 1),
+                'min': round(min(seconds) * 1000, 1),
+            },
+            'import_ms': round(sum(cumulative for _, _, cumulative, depth in imports if depth == 0) / 1000, 1),
+            'modules': modules,
+            'packages_ms': {package: round(us / 1000, 1) for package, us in package_times(imports).most_common()},
+            'log': log,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=10, help='Timed boots per profile, after one warm-up boot.')
+    parser.add_argument('--profiles', nargs='+', choices=PROFILES, default=list(PROFILES))
+    parser.add_argument('--top', type=int, default=15, help='Packages listed in the import report.')
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    parser.add_argument('--logs', help='Directory for the raw `-X importtime` output.')
+    args = parser.parse_args()
+
+    results = run(args.profiles, args.runs)
+    for profile, boots in results.items():
+        for name, result in boots.items():
+            print(f'{profile:<5} {name:<7} wall {result["wall_ms"]["median"]:7.1f} ms '
+                  f'(min {result["wall_ms"]["min"]:7.1f})  imports {result["import_ms"]:7.1f} ms  '
+                  f'modules {result["modules"]:5}')
+
+    for profile in args.profiles:
+        print(f'\nSlowest packages to import, {profile} worker boot (own time, ms)')
+        for package, ms in list(results[profile]['worker']['packages_ms'].items())[:args.top]:
+            print(f'  {package:<24} {ms:7.1f}')
+
+    if args.logs:
+        logs = Path(args.logs)
+        logs.mkdir(parents=True, exist_ok=True)
+        for profile, boots in results.items():
+            for name, result in boots.items():
+                (logs / f'importtime-{profile}-{name}.txt').write_text(result['log'])
+    for boots in results.values():
+        for result in boots.values():
+            del result['log']
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'runs': args.runs, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
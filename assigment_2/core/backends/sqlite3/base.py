@@ -0,0 +1,89 @@
+"""
+SQLite backend tuned for many concurrent readers and a queue of writers.
+
+Extra `OPTIONS` understood on top of the stock backend:
+
+- `pragmas`: dict of `PRAGMA name = value` statements run on every new
+  connection, e.g. `journal_mode`, `synchronous`, `busy_timeout`.
+- `transaction_mode`: `'IMMEDIATE'` makes `atomic()` start with
+  `BEGIN IMMEDIATE`, so a transaction takes the write lock up front and
+  waits on `busy_timeout` instead of failing with "database is locked" when
+  it later tries to upgrade a read lock. Writers in the same process also
+  queue on a lock per database file, so they are woken in turn instead of
+  polling SQLite's busy handler.
+"""
+import threading
+from collections import defaultdict
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+_write_locks = defaultdict(threading.RLock)
+_write_locks_guard = threading.Lock()
+
+
+def write_lock(name):
+    with _write_locks_guard:
+        return _write_locks[str(name)]
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        options = self.settings_dict['OPTIONS']
+        self.pragmas = dict(options.get('pragmas', {}))
+        self.transaction_mode = options.get('transaction_mode')
+        if self.transaction_mode not in (None, 'DEFERRED', 'IMMEDIATE', 'EXCLUSIVE'):
+            raise ImproperlyConfigured(
+                f"transaction_mode must be DEFERRED, IMMEDIATE or EXCLUSIVE, not {self.transaction_mode!r}."
+            )
+        self.holds_write_lock = False
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        kwargs.pop('pragmas', None)
+        kwargs.pop('transaction_mode', None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        if not self.is_in_memory_db():
+            for name, value in self.pragmas.items():
+                conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            return super()._start_transaction_under_autocommit()
+
+        if self.transaction_mode == 'IMMEDIATE' and not self.is_in_memory_db():
+            timeout = int(self.pragmas.get('busy_timeout', 5000)) / 1000
+            self.holds_write_lock = write_lock(self.settings_dict['NAME']).acquire(timeout=timeout)
+        try:
+            self.cursor().execute(f'BEGIN {self.transaction_mode}')
+        except Exception:
+            self.release_write_lock()
+            raise
+
+    def release_write_lock(self):
+        if self.holds_write_lock:
+            self.holds_write_lock = False
+            write_lock(self.settings_dict['NAME']).release()
+
+    def _commit(self):
+        try:
+            return super()._commit()
+        finally:
+            self.release_write_lock()
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self.release_write_lock()
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            self.release_write_lock()
@@ -0,0 +1,106 @@
+"""
+Read-replica routing.
+
+Reads go to one of the aliases in `settings.DATABASE_REPLICAS`, writes go
+to `default`. Reads are pinned to `default` while:
+
+- the request itself is a write (any method other than GET/HEAD/OPTIONS),
+- a transaction is open on `default`, so read-then-write code such as
+  `SellDetail.save` sees the rows it is about to change,
+- the client wrote something in the last `REPLICA_PIN_SECONDS` seconds,
+  tracked with a cookie, so it reads its own writes while the replicas
+  catch up.
+
+Without replicas configured every query goes to `default` as before.
+"""
+import contextvars
+import itertools
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'primary_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_pinned = contextvars.ContextVar('pinned_to_primary', default=False)
+_counter = itertools.count()
+
+
+@contextmanager
+def pin_to_primary():
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def is_pinned():
+    return _pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if not replicas or is_pinned():
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return replicas[next(_counter) % len(replicas)]
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary and never migrated directly.
+        return db not in getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+class ReadYourWritesMiddleware:
+    """
+    Pin reads to the primary for write requests and, for
+    `REPLICA_PIN_SECONDS` after a successful write, for the same client.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'DATABASE_REPLICAS', []):
+            return self.get_response(request)
+
+        now = time.time()
+        try:
+            pinned_until = float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        write = request.method not in SAFE_METHODS
+
+        if write or pinned_until > now:
+            with pin_to_primary():
+                response = self.get_response(request)
+        else:
+            response = self.get_response(request)
+
+        if write and response.status_code < 400:
+            window = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+            response.set_cookie(PIN_COOKIE, f'{now + window:.3f}', max_age=window, httponly=True, samesite='Lax')
+        return response
+
+
+def sync_replica(source, target):
+    """
+    Copy the primary SQLite database into a replica with the online backup
+    API. The copy is a consistent snapshot; readers of the replica wait on
+    `busy_timeout` while it is replaced.
+    """
+    source.ensure_connection()
+    target.ensure_connection()
+    with source.wrap_database_errors:
+        source.connection.backup(target.connection)
@@ -42,6 +42,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'warehouse.middleware.MetricsMiddleware',
+    'core.replicas.ReadYourWritesMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,6 +84,17 @@ DATABASES = {
     }
 }
 
+# Read replicas, see core/replicas.py. List aliases of DATABASES to send
+# reads to; a client that wrote reads from the primary for
+# REPLICA_PIN_SECONDS afterwards.
+DATABASE_ROUTERS = ['core.sharding.ShardRouter', 'core.replicas.ReplicaRouter']
+DATABASE_REPLICAS = []
+REPLICA_PIN_SECONDS = 5
+
+# Item-hash shards, see core/sharding.py and core/settings_sharded.py. Leave
+# empty to keep every table in `default`.
+WAREHOUSE_SHARDS = []
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -130,7 +143,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'warehouse.renderers.FastJSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
     ],
     'DEFAULT_PARSER_CLASSES': [
@@ -139,4 +152,17 @@ REST_FRAMEWORK = {
         'rest_framework.parsers.MultiPartParser'
     ],
 
-}
\ No newline at end of file
+}
+
+# Serve list endpoints from values_list() rows instead of ModelSerializer
+WAREHOUSE_FAST_READ = True
+
+# Request profiling, see warehouse.middleware.MetricsMiddleware. Leave the
+# directory unset to disable it entirely.
+WAREHOUSE_PROFILE_DIR = None
+WAREHOUSE_PROFILE_ALL = False
+
+# Clients allowed to read /metrics/ and to profile requests with X-Profile.
+# Behind a proxy REMOTE_ADDR is the proxy, so list the scraper's address
+# only if the proxy does not forward outside traffic to /metrics/.
+INTERNAL_IPS = ['127.0.0.1', '::1']
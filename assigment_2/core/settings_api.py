@@ -0,0 +1,37 @@
+"""
+API-only profile: `DJANGO_SETTINGS_MODULE=core.settings_api`.
+
+The warehouse API of `core.settings` without the admin, auth, sessions,
+messages, templates and the browsable API, for headless API workers and
+batch commands such as `import_transactions` and `generate_data`. Requests
+are anonymous and responses are JSON (or the CSV and XLSX exports).
+`python -m benchmarks.startup` compares the boot time of both profiles.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import REST_FRAMEWORK
+
+INSTALLED_APPS = [
+    'warehouse.apps.WarehouseConfig',
+]
+
+MIDDLEWARE = [
+    'warehouse.middleware.MetricsMiddleware',
+    'core.replicas.ReadYourWritesMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+ROOT_URLCONF = 'core.urls_api'
+
+TEMPLATES = []
+
+AUTH_PASSWORD_VALIDATORS = []
+
+REST_FRAMEWORK = dict(
+    REST_FRAMEWORK,
+    DEFAULT_RENDERER_CLASSES=['warehouse.renderers.FastJSONRenderer'],
+    # Without django.contrib.auth there is no user model to authenticate
+    # against; request.user is None.
+    DEFAULT_AUTHENTICATION_CLASSES=[],
+    UNAUTHENTICATED_USER=None,
+)
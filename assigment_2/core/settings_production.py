@@ -0,0 +1,39 @@
+"""
+Production profile: `DJANGO_SETTINGS_MODULE=core.settings_production`.
+
+Same application as `core.settings`, with SQLite tuned for concurrent use:
+WAL journaling, pragmas applied on every connection, persistent
+connections and `BEGIN IMMEDIATE` transactions so concurrent writers queue
+instead of failing with "database is locked".
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR
+
+DEBUG = False
+
+ALLOWED_HOSTS = [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', 'localhost').split(',') if host]
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'core.backends.sqlite3',
+        'NAME': os.environ.get('DJANGO_SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        # Keep connections open between requests; checked before reuse.
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 10,
+            'transaction_mode': 'IMMEDIATE',
+            'pragmas': {
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',
+                'busy_timeout': 10000,
+                # Negative cache_size is in KiB: 64 MiB page cache.
+                'cache_size': -64000,
+                'mmap_size': 268435456,
+                'temp_store': 'MEMORY',
+            },
+        },
+    }
+}
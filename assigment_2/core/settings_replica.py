@@ -0,0 +1,25 @@
+"""
+Local read-replica setup: `DJANGO_SETTINGS_MODULE=core.settings_replica`.
+
+The replica is a second SQLite file kept up to date by
+`python manage.py sync_replicas --interval 2`, which stands in for
+replication lag without any external service.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES
+
+DATABASES['replica'] = {
+    'ENGINE': 'core.backends.sqlite3',
+    'NAME': BASE_DIR / 'db.replica.sqlite3',
+    'OPTIONS': {
+        'pragmas': {'busy_timeout': 5000},
+    },
+    'TEST': {
+        'MIRROR': 'default',
+    },
+}
+
+DATABASE_REPLICAS = ['replica']
+
+# Keep this above the sync interval so clients always read their own writes.
+REPLICA_PIN_SECONDS = 5
@@ -0,0 +1,19 @@
+"""
+Sharded setup: `DJANGO_SETTINGS_MODULE=core.settings_sharded`.
+
+Items and their purchase and sell lines are spread over four SQLite files
+by a hash of the item code, see core/sharding.py. `default` is shard 0 and
+also keeps the Django contrib tables. Migrate every shard once:
+
+    for db in default shard1 shard2 shard3; do python manage.py migrate --database $db; done
+
+The shard count is fixed once data is written: changing it moves items to
+other shards.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES
+
+WAREHOUSE_SHARDS = ['default', 'shard1', 'shard2', 'shard3']
+
+for alias in WAREHOUSE_SHARDS[1:]:
+    DATABASES[alias] = dict(DATABASES['default'], NAME=BASE_DIR / f'db.{alias}.sqlite3')
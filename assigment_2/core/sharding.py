@@ -0,0 +1,152 @@
+"""
+Item-hash sharding of the warehouse tables.
+
+With `settings.WAREHOUSE_SHARDS` listing database aliases, each item lives
+on the shard picked by a stable hash of `Item.code`, together with every
+purchase and sell line of that item. Headers are stored on the shard of
+their own code and copied to each shard that holds one of their lines, so
+foreign keys and the FIFO queries in `SellDetail.save` never leave a
+shard.
+
+Views enter `use_shard()` for requests that belong to one item or header;
+everything routed without an instance hint inside it goes to that shard.
+Lists query every shard and merge the rows (`shard_querysets`,
+`merge_sorted`). Auto-increment ids are offset by `ID_BLOCK` per shard so
+line ids stay unique across shards.
+
+Without shards configured the router abstains and nothing changes.
+"""
+import contextvars
+import heapq
+import zlib
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SHARDED_APPS = ('warehouse',)
+ID_BLOCK = 10 ** 12
+
+_current = contextvars.ContextVar('current_shard', default=None)
+
+
+def shard_aliases():
+    return getattr(settings, 'WAREHOUSE_SHARDS', [])
+
+
+def shard_for(key):
+    aliases = shard_aliases()
+    return aliases[zlib.crc32(str(key).encode()) % len(aliases)]
+
+
+def current_shard():
+    aliases = shard_aliases()
+    return _current.get() or (aliases[0] if aliases else DEFAULT_DB_ALIAS)
+
+
+@contextmanager
+def use_shard(alias):
+    token = _current.set(alias)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def shard_key(instance):
+    # Lines follow their item; items and headers are placed by their code.
+    if hasattr(instance, 'item_id'):
+        return instance.item_id
+    return instance.pk
+
+
+def shard_querysets(queryset):
+    aliases = shard_aliases()
+    if not aliases:
+        return [queryset]
+    return [queryset.using(alias) for alias in aliases]
+
+
+class _Descending:
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def ordering_key(ordering):
+    fields = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+    def key(row):
+        return tuple(_Descending(row[name]) if descending else row[name] for name, descending in fields)
+    return key
+
+
+def merge_sorted(results, ordering):
+    """Merge per-shard row dicts that are each sorted by `ordering`."""
+    if len(results) == 1:
+        return list(results[0])
+    return list(heapq.merge(*results, key=ordering_key(ordering)))
+
+
+class ShardRouter:
+    def _route(self, model, **hints):
+        aliases = shard_aliases()
+        if not aliases:
+            return None
+        if model._meta.app_label not in SHARDED_APPS:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None:
+            if instance._state.db:
+                return instance._state.db
+            if type(instance) is model and shard_key(instance):
+                return shard_for(shard_key(instance))
+        return current_shard()
+
+    db_for_read = _route
+    db_for_write = _route
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not shard_aliases():
+            return None
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        aliases = shard_aliases()
+        if not aliases:
+            return None
+        if app_label in SHARDED_APPS:
+            return db in aliases
+        return db == DEFAULT_DB_ALIAS
+
+
+def seed_sequences(app_config, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    `post_migrate` handler: start the AUTOINCREMENT counters of shard N at
+    N * ID_BLOCK, so ids never collide when lists from several shards are
+    merged.
+    """
+    aliases = shard_aliases()
+    if using not in aliases or connections[using].vendor != 'sqlite':
+        return
+    offset = aliases.index(using) * ID_BLOCK
+    if not offset:
+        return
+    with connections[using].cursor() as cursor:
+        for model in app_config.get_models():
+            if model._meta.auto_field is None:
+                continue
+            table = model._meta.db_table
+            cursor.execute(
+                'INSERT INTO sqlite_sequence (name, seq) SELECT %s, 0 '
+                'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)',
+                [table, table],
+            )
+            cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s', [offset, table, offset])
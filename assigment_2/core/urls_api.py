@@ -0,0 +1,7 @@
+from django.urls import path, include
+from warehouse.metrics import metrics_view
+
+urlpatterns = [
+    path('api/', include('warehouse.urls')),
+    path('metrics/', metrics_view, name='metrics'),
+]
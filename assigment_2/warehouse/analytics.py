@@ -0,0 +1,164 @@
+"""
+Movement totals computed in SQL over the `StockMovement` ledger.
+
+The ledger already holds one row per purchase and sell line with the
+header date and the FIFO cost in date order on it, as in the stock card; a
+back-dated line re-costs the later rows, see `ledger.recost()`. So the
+totals need neither the header join nor a FIFO replay: they are grouped
+sums over the movements in the date range, read
+through the `movement_date_idx` covering index. Only the requested page is
+fetched; with sharding every shard returns its candidates for that page and
+they are combined here.
+"""
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, F, OuterRef, Q, Subquery, Sum, Value, Window
+from django.db.models import functions
+from django.db.models.functions import Coalesce, RowNumber
+
+from core.sharding import merge_sorted, shard_querysets
+from .models import Item, StockMovement
+
+TOTALS = ('purchased_qty', 'purchased_cost', 'sold_qty', 'sold_cost', 'lines')
+ITEM_ORDERING = TOTALS + ('item',)
+
+AMOUNT = DecimalField(max_digits=15, decimal_places=2)
+ZERO = Value(Decimal('0'), output_field=AMOUNT)
+
+
+class TruncMonth(functions.TruncMonth):
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # Django's SQLite version calls a Python function for every row,
+        # which takes longer than the rest of the query; the column is a date.
+        sql, params = compiler.compile(self.lhs)
+        return f"strftime('%%Y-%%m-01', {sql})", params
+
+
+def totals():
+    purchase = Q(kind=StockMovement.PURCHASE)
+    sell = Q(kind=StockMovement.SELL)
+    # Sell rows are stored with a negative quantity and cost.
+    return {
+        'purchased_qty': Coalesce(Sum('quantity', filter=purchase), ZERO),
+        'purchased_cost': Coalesce(Sum('cost', filter=purchase), ZERO),
+        'sold_qty': Coalesce(-Sum('quantity', filter=sell), ZERO),
+        'sold_cost': Coalesce(-Sum('cost', filter=sell), ZERO),
+        'lines': Count('id'),
+    }
+
+
+def movements(start_date=None, end_date=None, items=None):
+    queryset = StockMovement.objects.all()
+    if start_date:
+        queryset = queryset.filter(date__gte=start_date)
+    if end_date:
+        queryset = queryset.filter(date__lte=end_date)
+    if items:
+        queryset = queryset.filter(item_id__in=items)
+    return queryset
+
+
+def stock_value(**filters):
+    """FIFO value of the outer item after its last movement matching `filters`."""
+    last = (
+        StockMovement.objects.filter(item=OuterRef('code'), **filters)
+        .order_by('-date', '-id')
+        .values('cumulative_cost')[:1]
+    )
+    return Coalesce(Subquery(last, output_field=AMOUNT), ZERO)
+
+
+def item_totals(start_date=None, end_date=None, items=None, ordering='-sold_cost'):
+    return (
+        movements(start_date, end_date, items)
+        .values('item')
+        .annotate(**totals())
+        .order_by(ordering, 'item_id')
+    )
+
+
+def add_turnover(rows, start_date=None, end_date=None):
+    """
+    Add the stock value before and after the range to item rows and the
+    turnover: cost of goods sold over the average of the two. The values are
+    two index lookups per item of the page, so they are not part of the
+    grouped query, where they would be evaluated for every movement.
+    """
+    opening = stock_value(date__lt=start_date) if start_date else ZERO
+    closing = stock_value(date__lte=end_date) if end_date else stock_value()
+    items = Item.objects.filter(code__in=[row['item'] for row in rows])
+    values = {}
+    for shard in shard_querysets(items):
+        shard = shard.annotate(opening=opening, closing=closing).values_list('code', 'opening', 'closing')
+        values.update((code, pair) for code, *pair in shard)
+    for row in rows:
+        row['opening_value'], row['closing_value'] = values[row['item']]
+        average = (row['opening_value'] + row['closing_value']) / 2
+        row['turnover'] = row['sold_cost'] / average if average else None
+    return rows
+
+
+def monthly_totals(start_date=None, end_date=None, items=None):
+    return (
+        movements(start_date, end_date, items)
+        .annotate(month=TruncMonth('date'))
+        .values('month')
+        .annotate(**totals())
+        .order_by('month')
+    )
+
+
+def top_items(start_date=None, end_date=None, items=None, by='sold_qty', top=10):
+    """The `top` items of every month by one of the totals, ranked from 1."""
+    return (
+        movements(start_date, end_date, items)
+        .annotate(month=TruncMonth('date'))
+        .values('month', 'item')
+        .annotate(**totals())
+        .annotate(rank=Window(RowNumber(), partition_by=F('month'), order_by=[F(by).desc(), F('item').asc()]))
+        .filter(rank__lte=top)
+        .order_by('month', 'rank')
+    )
+
+
+def fetch_items(queryset, limit, offset, ordering):
+    # Items never span shards, so a page is a merge of every shard's first
+    # offset + limit rows. One extra row tells whether another page follows.
+    shards = shard_querysets(queryset)
+    if len(shards) == 1:
+        return list(queryset[offset:offset + limit + 1])
+    rows = merge_sorted([list(shard[:offset + limit + 1]) for shard in shards], [ordering, 'item'])
+    return rows[offset:offset + limit + 1]
+
+
+def fetch_months(queryset, limit, offset):
+    shards = shard_querysets(queryset)
+    if len(shards) == 1:
+        return list(queryset[offset:offset + limit + 1])
+    months = {}
+    for shard in shards:
+        for row in shard:
+            if row['month'] in months:
+                for name in TOTALS:
+                    months[row['month']][name] += row[name]
+            else:
+                months[row['month']] = row
+    return [months[month] for month in sorted(months)][offset:offset + limit + 1]
+
+
+def fetch_top(queryset, limit, offset, by, top):
+    shards = shard_querysets(queryset)
+    if len(shards) == 1:
+        return list(queryset[offset:offset + limit + 1])
+    # Every shard ranks its own items; the overall top of a month is among
+    # the union of their tops.
+    rows = merge_sorted([list(shard) for shard in shards], ['month', f'-{by}', 'item'])
+    ranked = []
+    for row in rows:
+        if ranked and ranked[-1]['month'] == row['month']:
+            row['rank'] = ranked[-1]['rank'] + 1
+        else:
+            row['rank'] = 1
+        if row['rank'] <= top:
+            ranked.append(row)
+    return ranked[offset:offset + limit + 1]
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
 
 
 class WarehouseConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'warehouse'
+
+    def ready(self):
+        from core.sharding import seed_sequences
+        from .middleware import install_query_recorder
+        from .search_index import install_index
+        post_migrate.connect(seed_sequences, sender=self)
+        post_migrate.connect(install_index, sender=self)
+        connection_created.connect(install_query_recorder)
@@ -0,0 +1,194 @@
+"""
+Change feed over the `ChangeLog` table.
+
+A row is appended in the transaction of every new purchase or sell line.
+SQLite lets one writer in at a time and the ids are AUTOINCREMENT, so ids
+are handed out in commit order and "every change after id N" never skips a
+change that commits later.
+
+The log is not a copy of the ledger. A back-dated line or a header date
+change rewrites the ledger of the items involved from that date on and
+changes the cost of their later sales; the log gets no row for those. The
+row of a back-dated line carries the item's stock and balance after the
+rewrite, and a header date change adds no row at all.
+
+A cursor is the last id a consumer has seen: one number, or one per shard
+separated by commas when `WAREHOUSE_SHARDS` is configured. Changes are
+served as a catch-up and long-poll API at `/api/changes/` and as
+server-sent events at `/api/changes/stream/`.
+
+Writers in this process wake waiting consumers from `on_commit`; changes
+committed by other processes are picked up by reading the log again every
+`POLL_SECONDS`.
+"""
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from django.http import JsonResponse, StreamingHttpResponse
+
+from core.sharding import shard_querysets
+from .encoders import row_encoder
+from .models import ChangeLog
+from .serializers import ChangeLogSerializer
+
+BATCH_SIZE = 100
+MAX_BATCH_SIZE = 1000
+MAX_WAIT_SECONDS = 30
+# A WSGI worker thread is held for the whole wait.
+WSGI_MAX_WAIT_SECONDS = 2
+POLL_SECONDS = 0.5
+HEARTBEAT_SECONDS = 15
+# Streams end after this long; EventSource reconnects with Last-Event-ID.
+STREAM_SECONDS = 300
+RETRY_MILLISECONDS = 1000
+
+
+class Broker:
+    """Wakes threads and event loops waiting for the next commit."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = set()
+
+    def notify(self):
+        with self._lock:
+            waiters = list(self._waiters)
+        for loop, event in waiters:
+            if loop is None:
+                event.set()
+                continue
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:  # The loop has been closed.
+                pass
+
+    def wait(self, timeout):
+        waiter = (None, threading.Event())
+        with self._lock:
+            self._waiters.add(waiter)
+        try:
+            waiter[1].wait(timeout)
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+    async def wait_async(self, timeout):
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+
+broker = Broker()
+
+
+def notify():
+    broker.notify()
+
+
+def parse_cursor(value):
+    count = len(shard_querysets(ChangeLog.objects.all()))
+    if not value:
+        return [0] * count
+    try:
+        positions = [int(position) for position in value.split(',')]
+    except ValueError:
+        positions = []
+    if len(positions) != count or min(positions) < 0:
+        raise ValueError(f'Invalid cursor {value!r}, expected {count} comma separated sequence numbers.')
+    return positions
+
+
+def format_cursor(positions):
+    return ','.join(map(str, positions))
+
+
+def read(positions, limit):
+    """
+    Return up to `limit` changes after `positions` as `(shard index, change)`
+    pairs, oldest first, and whether more are waiting. Changes of different
+    shards are ordered by their timestamp.
+    """
+    entries = []
+    for index, (changes, after) in enumerate(zip(shard_querysets(ChangeLog.objects.all()), positions)):
+        rows = row_encoder(ChangeLogSerializer).encode(changes.filter(id__gt=after).order_by('id')[:limit + 1])
+        entries.extend((row['created_at'], row['id'], index, row) for row in rows)
+    entries.sort(key=lambda entry: entry[:2])
+    return [(index, row) for _, _, index, row in entries[:limit]], len(entries) > limit
+
+
+def poll(positions, limit, wait):
+    """`read()`, waiting up to `wait` seconds for a change if there is none."""
+    deadline = time.monotonic() + wait
+    while True:
+        entries, more = read(positions, limit)
+        remaining = deadline - time.monotonic()
+        if entries or remaining <= 0:
+            return entries, more
+        broker.wait(min(POLL_SECONDS, remaining))
+
+
+def max_wait(request):
+    """Longest `?wait=` served to `request`, long only under ASGI."""
+    return MAX_WAIT_SECONDS if isinstance(request, ASGIRequest) else WSGI_MAX_WAIT_SECONDS
+
+
+def read_pooled(positions, limit):
+    close_old_connections()
+    return read(positions, limit)
+
+
+# Stream reads run on their own threads, each with its own connection, so
+# that open streams neither queue behind nor block the thread sensitive
+# code of other requests.
+readers = ThreadPoolExecutor(max_workers=4, thread_name_prefix='change-stream')
+read_async = sync_to_async(read_pooled, thread_sensitive=False, executor=readers)
+
+
+def format_event(change, positions):
+    return f'id: {format_cursor(positions)}\nevent: change\ndata: {json.dumps(change)}\n\n'
+
+
+async def events(positions):
+    started = last_sent = time.monotonic()
+    yield f'retry: {RETRY_MILLISECONDS}\n\n'
+    while time.monotonic() - started < STREAM_SECONDS:
+        entries, more = await read_async(positions, BATCH_SIZE)
+        for index, change in entries:
+            positions[index] = change['id']
+            yield format_event(change, positions)
+        if entries:
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= HEARTBEAT_SECONDS:
+            last_sent = time.monotonic()
+            yield ': keepalive\n\n'
+        if not more:
+            await broker.wait_async(POLL_SECONDS)
+
+
+async def stream(request):
+    """Server-sent events of every change after `Last-Event-ID` or `?after=`."""
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'The change stream needs the ASGI application, '
+                                      'use /api/changes/?wait= to long-poll instead.'}, status=501)
+    try:
+        positions = parse_cursor(request.headers.get('Last-Event-ID') or request.GET.get('after'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    response = StreamingHttpResponse(events(positions), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,136 @@
+import decimal
+from functools import lru_cache
+
+from rest_framework import serializers
+from rest_framework.settings import ISO_8601, api_settings
+
+
+def _decimal_encoder(field):
+    # Same output as DecimalField.to_representation, with the quantize
+    # exponent and context built once instead of on every value.
+    if field.localize or field.normalize_output:
+        return field.to_representation
+
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    rounding = field.rounding
+    exponent = None
+    if field.decimal_places is not None:
+        exponent = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+
+    def encode(value):
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        if exponent is not None:
+            value = value.quantize(exponent, rounding=rounding, context=context)
+        if not coerce_to_string:
+            return value
+        return '{:f}'.format(value)
+
+    return encode
+
+
+def _date_encoder(field):
+    output_format = getattr(field, 'format', api_settings.DATE_FORMAT)
+    if output_format is not None and output_format.lower() == ISO_8601:
+        return lambda value: value if isinstance(value, str) else value.isoformat()
+    return field.to_representation
+
+
+def compile_field(field):
+    """
+    Return a callable turning a raw `values_list()` column into the same
+    primitive the serializer field would produce for a model instance.
+    """
+    if isinstance(field, serializers.DecimalField):
+        return _decimal_encoder(field)
+    if isinstance(field, serializers.DateField):
+        return _date_encoder(field)
+    if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+        # `values_list('item')` already yields the related primary key.
+        return None
+    if type(field) is serializers.CharField:
+        return str
+    if type(field) is serializers.IntegerField:
+        return int
+    return field.to_representation
+
+
+class RowEncoder:
+    """
+    Read-only counterpart of a `ModelSerializer` that works on
+    `values_list()` rows instead of model instances.
+
+    Nested `many=True` serializers over a reverse foreign key are fetched
+    with one extra query for the whole result set instead of one per row.
+    """
+
+    def __init__(self, serializer_class):
+        serializer = serializer_class()
+        self.model = serializer.Meta.model
+        self.columns = []
+        self.nested = []
+
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.ListSerializer):
+                relation = self.model._meta.get_field(field.source)
+                self.nested.append((name, relation.field.name, row_encoder(type(field.child))))
+            else:
+                self.columns.append((name, field.source, compile_field(field)))
+
+        self.sources = [source for _, source, _ in self.columns]
+        if self.nested:
+            self.sources.append('pk')
+
+    def encode_row(self, row):
+        ret = {}
+        for (name, _, encode), value in zip(self.columns, row):
+            if value is None or encode is None:
+                ret[name] = value
+            else:
+                ret[name] = encode(value)
+        return ret
+
+    def encode(self, queryset):
+        rows = queryset.values_list(*self.sources)
+
+        if not self.nested:
+            return [self.encode_row(row) for row in rows]
+
+        rows = list(rows)
+        children = [
+            (name, encoder.encode_grouped(fk_name, queryset.values('pk')))
+            for name, fk_name, encoder in self.nested
+        ]
+
+        result = []
+        for row in rows:
+            ret = self.encode_row(row)
+            for name, grouped in children:
+                ret[name] = grouped.get(row[-1], [])
+            result.append(ret)
+        return result
+
+    def encode_grouped(self, fk_name, parents):
+        # Related managers have no default ordering here, so follow the
+        # primary key the same way `header.details.all()` does on SQLite.
+        rows = (
+            self.model._default_manager
+            .using(parents.db)
+            .filter(**{f'{fk_name}__in': parents})
+            .order_by('pk')
+            .values_list(fk_name, *self.sources)
+        )
+        grouped = {}
+        for row in rows:
+            grouped.setdefault(row[0], []).append(self.encode_row(row[1:]))
+        return grouped
+
+
+@lru_cache(maxsize=None)
+def row_encoder(serializer_class):
+    return RowEncoder(serializer_class)
@@ -0,0 +1,206 @@
+import csv
+import io
+import logging
+import re
+import zipfile
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.http import StreamingHttpResponse
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'zip': 'application/zip',
+}
+EXPORT_FORMATS = ('csv', 'xlsx')
+# The status line has gone out when a streamed export fails, so the failure
+# is logged and written into the file as its last row.
+EXPORT_ERROR = 'Export failed, this file is incomplete.'
+INVALID_SHEET_CHARACTERS = re.compile(r'[\[\]:*?/\\]')
+# Control characters other than tab and newlines are not allowed in XML 1.0,
+# escaped or not; readers refuse the whole workbook.
+INVALID_XML_CHARACTERS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+
+logger = logging.getLogger(__name__)
+
+
+class StreamBuffer:
+    """Write-only file object for `zipfile`; callers drain it with `pop()`."""
+
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+        self.pending = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        self.pending += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        self.pending = 0
+        return data
+
+
+def _cell(value):
+    if isinstance(value, (list, tuple)):
+        return ';'.join(str(part) for part in value)
+    return value
+
+
+def csv_stream(header, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    try:
+        for row in rows:
+            writer.writerow([_cell(value) for value in row])
+            if buffer.tell() >= 65536:
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+    except Exception:
+        logger.exception('CSV export failed')
+        writer.writerow([EXPORT_ERROR])
+    yield buffer.getvalue().encode()
+
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="{sheet}" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def xml_text(value, entities=None):
+    return escape(INVALID_XML_CHARACTERS.sub('', value), entities or {})
+
+
+def _column_letter(index):
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _xlsx_row(number, values):
+    cells = []
+    for index, value in enumerate(values):
+        value = _cell(value)
+        ref = f'{_column_letter(index)}{number}'
+        if value is None:
+            continue
+        if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+            cells.append(f'<c r="{ref}"><v>{value}</v></c>')
+        else:
+            cells.append(f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{xml_text(str(value))}</t></is></c>')
+    return f'<row r="{number}">{"".join(cells)}</row>'
+
+
+def sheet_name(name):
+    """Excel rejects sheet names over 31 characters or with any of []:*?/\\."""
+    return INVALID_SHEET_CHARACTERS.sub('', name)[:31] or 'Sheet1'
+
+
+def xlsx_stream(header, rows, sheet='Sheet1'):
+    """
+    Minimal single-sheet XLSX workbook written row by row with inline
+    strings, so no shared-string table has to be kept in memory.
+    """
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content.replace('{sheet}', xml_text(sheet_name(sheet), {'"': '&quot;'}), 1))
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as part:
+            part.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            part.write(_xlsx_row(1, header).encode())
+            number = 1
+            try:
+                for number, row in enumerate(rows, start=2):
+                    part.write(_xlsx_row(number, row).encode())
+                    if buffer.pending >= 65536:
+                        yield buffer.pop()
+            except Exception:
+                logger.exception('XLSX export failed')
+                part.write(_xlsx_row(number + 1, [EXPORT_ERROR]).encode())
+            part.write(b'</sheetData></worksheet>')
+        yield buffer.pop()
+    yield buffer.pop()
+
+
+def zip_stream(files):
+    """
+    Bundle `(filename, chunks)` pairs into one ZIP archive, pulling each
+    file's chunks only while it is being written.
+    """
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        try:
+            for filename, chunks in files:
+                with archive.open(filename, 'w', force_zip64=True) as entry:
+                    for chunk in chunks:
+                        entry.write(chunk)
+                        if buffer.pending >= 65536:
+                            yield buffer.pop()
+        except Exception:
+            logger.exception('ZIP export failed')
+            archive.writestr('EXPORT-ERROR.txt', EXPORT_ERROR)
+    yield buffer.pop()
+
+
+def export_stream(export_format, header, rows, sheet='Sheet1'):
+    if export_format == 'xlsx':
+        return xlsx_stream(header, rows, sheet=sheet)
+    return csv_stream(header, rows)
+
+
+def streaming_response(chunks, filename, content_type):
+    response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[content_type])
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,53 @@
+from collections import deque
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+
+
+class ItemStock:
+    """
+    In-memory FIFO state of a single item, doing the same bookkeeping as
+    `PurchaseDetail.save` and `SellDetail.save` without touching the database.
+
+    `lots` holds the open `PurchaseDetail` objects, oldest first.
+    """
+
+    def __init__(self, stock=Decimal('0'), balance=Decimal('0'), lots=()):
+        self.stock = stock
+        self.balance = balance
+        self.lots = deque(lots)
+        self.available = sum((lot.remaining_quantity for lot in self.lots), Decimal('0'))
+
+    def purchase(self, detail):
+        detail.remaining_quantity = detail.quantity
+        self.lots.append(detail)
+        self.available += detail.quantity
+        self.stock += detail.quantity
+        self.balance += detail.quantity * detail.unit_price
+
+    def sell(self, quantity):
+        """
+        Consume `quantity` from the oldest lots. Returns the cost of the sold
+        quantity and the lots that were changed; fully consumed lots are
+        dropped from `lots`.
+        """
+        if quantity > self.available:
+            raise ValidationError("Insufficient stock available.")
+
+        remaining_to_sell = quantity
+        total_cost = Decimal('0.0')
+        touched = []
+        while remaining_to_sell > 0:
+            lot = self.lots[0]
+            sold = min(remaining_to_sell, lot.remaining_quantity)
+            lot.remaining_quantity -= sold
+            total_cost += sold * lot.unit_price
+            remaining_to_sell -= sold
+            touched.append(lot)
+            if lot.remaining_quantity <= 0:
+                self.lots.popleft()
+
+        self.available -= quantity
+        self.stock -= quantity
+        self.balance -= total_cost
+        return total_cost, touched
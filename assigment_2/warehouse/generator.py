@@ -0,0 +1,151 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+
+from .fifo import ItemStock
+from .changes import notify
+from .models import ChangeLog, Item, PurchaseHeader, PurchaseDetail, SellHeader, SellDetail, StockMovement
+
+
+class DatasetGenerator:
+    """
+    Stream a synthetic, FIFO-consistent dataset into the database.
+
+    Orders are generated in date order. Purchases open a lot per line, sells
+    consume the oldest open lots of the item, so `remaining_quantity`,
+    `Item.stock` and `Item.balance` end up exactly where `PurchaseDetail.save`
+    and `SellDetail.save` would have left them. Rows are written with
+    `bulk_create` every `batch_size` rows; only the open purchase lots are
+    kept in memory.
+    """
+
+    def __init__(self, items=100, orders=100, lines=3, start_date=date(2024, 1, 1),
+                 days=365, purchase_ratio=0.5, seed=0, batch_size=1000, stdout=None):
+        self.item_count = items
+        self.order_count = orders
+        self.lines = lines
+        self.start_date = start_date
+        self.days = max(days, 1)
+        self.purchase_ratio = purchase_ratio
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.stdout = stdout
+
+        self.stocks = [ItemStock() for _ in range(items)]
+        self.buffers = {model: [] for model in (PurchaseHeader, SellHeader, PurchaseDetail, SellDetail, StockMovement,
+                                                ChangeLog)}
+        self.written = {model: 0 for model in (Item, PurchaseHeader, SellHeader, PurchaseDetail, SellDetail,
+                                               StockMovement, ChangeLog)}
+
+    @staticmethod
+    def item_code(index):
+        return f'ITEM{index:07d}'
+
+    def run(self):
+        with transaction.atomic():
+            self.create_items()
+            for number, order_date in enumerate(self.order_dates(), start=1):
+                if self.random.random() < self.purchase_ratio:
+                    self.purchase(number, order_date)
+                else:
+                    self.sell(number, order_date)
+            self.close_lots()
+            self.flush()
+            self.update_items()
+            transaction.on_commit(notify)
+        return self.written
+
+    def order_dates(self):
+        offsets = sorted(self.random.randrange(self.days) for _ in range(self.order_count))
+        return (self.start_date + timedelta(days=offset) for offset in offsets)
+
+    def create_items(self):
+        batch = []
+        for index in range(self.item_count):
+            code = self.item_code(index)
+            batch.append(Item(code=code, name=f'Product {code}', unit='unit',
+                              description=f'Generated product {code}'))
+            if len(batch) >= self.batch_size:
+                self.write(Item, batch)
+                batch = []
+        self.write(Item, batch)
+
+    def purchase(self, number, order_date):
+        header = PurchaseHeader(code=f'PO{number:08d}', date=order_date,
+                                description=f'Purchase order {number}')
+        self.add(header)
+        for index in self.random.sample(range(self.item_count), min(self.lines, self.item_count)):
+            quantity = Decimal(self.random.randint(1, 100))
+            unit_price = Decimal(self.random.randint(10, 500))
+            self.stocks[index].purchase(PurchaseDetail(
+                header_id=header.code, item_id=self.item_code(index),
+                quantity=quantity, unit_price=unit_price,
+            ))
+            self.movement(index, header, StockMovement.PURCHASE, quantity, quantity * unit_price)
+
+    def sell(self, number, order_date):
+        header = SellHeader(code=f'SO{number:08d}', date=order_date,
+                            description=f'Sales order {number}')
+        self.add(header)
+        for index in self.random.sample(range(self.item_count), min(self.lines, self.item_count)):
+            stock = self.stocks[index]
+            if stock.stock <= 0:
+                continue
+            quantity = Decimal(self.random.randint(1, int(stock.stock)))
+            cost, touched = stock.sell(quantity)
+            for lot in touched:
+                if lot.remaining_quantity <= 0:
+                    self.add(lot)
+            self.add(SellDetail(header_id=header.code, item_id=self.item_code(index), quantity=quantity))
+            self.movement(index, header, StockMovement.SELL, -quantity, -cost)
+
+    def movement(self, index, header, kind, quantity, cost):
+        stock = self.stocks[index]
+        self.add(StockMovement(
+            item_id=self.item_code(index), date=header.date, kind=kind, reference=header.code,
+            quantity=quantity, cost=cost,
+            cumulative_quantity=stock.stock, cumulative_cost=stock.balance,
+        ))
+        self.add(ChangeLog(
+            item_id=self.item_code(index), kind=kind, reference=header.code, quantity=quantity, cost=cost,
+            stock=stock.stock, balance=stock.balance,
+        ))
+
+    def close_lots(self):
+        for stock in self.stocks:
+            while stock.lots:
+                self.add(stock.lots.popleft())
+
+    def add(self, obj):
+        buffer = self.buffers[type(obj)]
+        buffer.append(obj)
+        if len(buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        # Headers first so details never reference a header not yet written.
+        for model, buffer in self.buffers.items():
+            self.write(model, buffer)
+            buffer.clear()
+
+    def write(self, model, objs):
+        if not objs:
+            return
+        model.objects.bulk_create(objs, batch_size=self.batch_size)
+        self.written[model] += len(objs)
+        if self.stdout is not None:
+            self.stdout.write(f'{model.__name__}: {self.written[model]}\r', ending='')
+
+    def update_items(self):
+        batch = []
+        for index, stock in enumerate(self.stocks):
+            if stock.stock == 0 and stock.balance == 0:
+                continue
+            batch.append(Item(code=self.item_code(index), stock=stock.stock, balance=stock.balance))
+            if len(batch) >= self.batch_size:
+                Item.objects.bulk_update(batch, ['stock', 'balance'])
+                batch = []
+        if batch:
+            Item.objects.bulk_update(batch, ['stock', 'balance'])
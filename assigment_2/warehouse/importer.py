@@ -0,0 +1,332 @@
+import csv
+import heapq
+import json
+import pickle
+import tempfile
+import time
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from .fifo import ItemStock
+from .ledger import recost
+from .changes import notify
+from .models import ChangeLog, Item, PurchaseHeader, PurchaseDetail, SellHeader, SellDetail, StockMovement
+
+PURCHASE = 0
+SELL = 1
+TYPES = {'purchase': PURCHASE, 'sell': SELL}
+COLUMNS = ('type', 'code', 'date', 'item', 'quantity', 'unit_price', 'description')
+
+
+def read_file(path):
+    """
+    Yield `(line_number, row)` for a CSV file with a header line, or for an
+    NDJSON file (`.ndjson` / `.jsonl`) with one object per line.
+    """
+    path = Path(path)
+    with path.open(newline='', encoding='utf-8') as f:
+        if path.suffix.lower() in ('.ndjson', '.jsonl'):
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as exc:
+                    raise ValidationError(f"{path}:{line_number}: invalid JSON: {exc}")
+                if not isinstance(row, dict):
+                    raise ValidationError(f"{path}:{line_number}: expected a JSON object.")
+                yield line_number, row
+        else:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+
+
+def parse_row(row, location):
+    try:
+        kind = TYPES[str(row['type']).strip().lower()]
+        quantity = Decimal(str(row['quantity']))
+        unit_price = Decimal(str(row['unit_price'])) if kind == PURCHASE else None
+        day = date.fromisoformat(str(row['date']).strip())
+        code = str(row['code']).strip()
+        item_code = str(row['item']).strip()
+    except KeyError as exc:
+        raise ValidationError(f"{location}: missing or unknown value for {exc}.")
+    except (InvalidOperation, ValueError) as exc:
+        raise ValidationError(f"{location}: {exc}")
+
+    if not code or not item_code:
+        raise ValidationError(f"{location}: Code and item must not be blank.")
+    if not quantity.is_finite() or (unit_price is not None and not unit_price.is_finite()):
+        raise ValidationError(f"{location}: Quantity and unit price must be finite numbers.")
+    if quantity <= 0:
+        raise ValidationError(f"{location}: Quantity must be positive.")
+    if unit_price is not None and unit_price <= 0:
+        raise ValidationError(f"{location}: Unit price must be positive.")
+
+    return day.toordinal(), kind, code, item_code, quantity, unit_price, row.get('description') or ''
+
+
+def _spill(rows):
+    run = tempfile.TemporaryFile()
+    for start in range(0, len(rows), 10000):
+        pickle.dump(rows[start:start + 10000], run, protocol=pickle.HIGHEST_PROTOCOL)
+    run.seek(0)
+    return run
+
+
+def _read_run(run):
+    with run:
+        while True:
+            try:
+                yield from pickle.load(run)
+            except EOFError:
+                return
+
+
+def sorted_rows(paths, buffer_size=250000):
+    """
+    Parse every input file and return `(count, rows)` where `rows` iterates
+    in date order, purchases before sells on the same date and in file order
+    otherwise, which is the order `Report.retrieve` replays them in.
+
+    At most `buffer_size` rows are held in memory; larger inputs are sorted
+    in runs spilled to temporary files and merged.
+    """
+    runs = []
+    chunk = []
+    count = 0
+    for path in paths:
+        for line_number, row in read_file(path):
+            location = f'{path}:{line_number}'
+            day, kind, *rest = parse_row(row, location)
+            chunk.append((day, kind, count, location, *rest))
+            count += 1
+            if len(chunk) >= buffer_size:
+                chunk.sort()
+                runs.append(_spill(chunk))
+                chunk = []
+
+    chunk.sort()
+    if not runs:
+        return count, iter(chunk)
+    return count, heapq.merge(*(_read_run(run) for run in runs), chunk)
+
+
+class TransactionImporter:
+    """
+    Insert sorted transaction rows in batches, running the FIFO allocation of
+    `SellDetail.save` in memory per item.
+
+    Each batch is written in one transaction: new headers and details with
+    `bulk_create`, then the changed `remaining_quantity`, `stock` and
+    `balance` values with one `executemany` per table. The database is
+    consistent after every batch, and `checkpoint(done)` is called inside the
+    batch transaction, so an interrupted import can resume after the last
+    committed row.
+    """
+
+    def __init__(self, batch_size=5000, create_items=False, stdout=None):
+        self.batch_size = batch_size
+        self.create_items = create_items
+        self.stdout = stdout
+        self.stocks = {}
+        self.versions = {}
+        self.written = {model: 0 for model in (Item, PurchaseHeader, SellHeader, PurchaseDetail, SellDetail,
+                                               StockMovement, ChangeLog)}
+
+    def run(self, rows, total, skip=0, checkpoint=None):
+        done = 0
+        started = time.perf_counter()
+        batch = []
+        for row in rows:
+            if done < skip:
+                done += 1
+                continue
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                done = self.commit(batch, done, total, started, skip, checkpoint)
+                batch = []
+        if batch:
+            done = self.commit(batch, done, total, started, skip, checkpoint)
+        return self.written
+
+    def commit(self, batch, done, total, started, skip, checkpoint):
+        done += len(batch)
+        with transaction.atomic(using=router.db_for_write(PurchaseDetail)):
+            self.import_batch(batch)
+            if checkpoint is not None:
+                checkpoint(done)
+        if self.stdout is not None:
+            rate = (done - skip) / max(time.perf_counter() - started, 1e-9)
+            self.stdout.write(f'{done}/{total} lines ({rate:,.0f} lines/s)')
+        return done
+
+    def import_batch(self, batch):
+        self.load_items({row[5] for row in batch})
+        headers = self.new_headers(batch)
+
+        details = {PurchaseDetail: [], SellDetail: [], StockMovement: []}
+        changes = []
+        dirty_lots = {}
+        dirty_items = set()
+        first_lines = {}
+        for day, kind, _, location, code, item_code, quantity, unit_price, _ in batch:
+            stock = self.stocks[item_code]
+            dirty_items.add(item_code)
+            first_lines.setdefault(item_code, (day, kind))
+            if kind == PURCHASE:
+                detail = PurchaseDetail(header_id=code, item_id=item_code,
+                                        quantity=quantity, unit_price=unit_price)
+                stock.purchase(detail)
+                details[PurchaseDetail].append(detail)
+                cost = quantity * unit_price
+            else:
+                try:
+                    cost, touched = stock.sell(quantity)
+                except ValidationError as exc:
+                    raise ValidationError(f'{location}: {item_code}: {exc.messages[0]}')
+                for lot in touched:
+                    if lot.pk is not None:
+                        dirty_lots[lot.pk] = lot
+                detail = SellDetail(header_id=code, item_id=item_code, quantity=quantity)
+                details[SellDetail].append(detail)
+                quantity, cost = -quantity, -cost
+            movement_kind = StockMovement.PURCHASE if kind == PURCHASE else StockMovement.SELL
+            details[StockMovement].append(StockMovement(
+                item_id=item_code, date=date.fromordinal(day), kind=movement_kind, reference=code,
+                quantity=quantity, cost=cost,
+                cumulative_quantity=stock.stock, cumulative_cost=stock.balance,
+            ))
+            changes.append((detail, ChangeLog(
+                item_id=item_code, kind=movement_kind, reference=code, quantity=quantity, cost=cost,
+                stock=stock.stock, balance=stock.balance,
+            )))
+
+        # Items that already have movements after their first line of this
+        # batch are re-costed in date order once the batch is in.
+        backdated = {
+            code
+            for code, day, kind in StockMovement.objects.filter(
+                item_id__in=dirty_items, date__gte=date.fromordinal(batch[0][0])
+            ).values_list('item_id', 'date', 'kind')
+            if (day.toordinal(), kind == StockMovement.SELL) > (first_lines[code][0], first_lines[code][1] == SELL)
+        }
+
+        for model, objs in list(headers.items()) + list(details.items()):
+            if objs:
+                model.objects.bulk_create(objs)
+                self.written[model] += len(objs)
+
+        now = timezone.now()
+        bulk_set(PurchaseDetail, ['remaining_quantity', 'updated_at'],
+                 [(lot.pk, lot.remaining_quantity, now) for lot in dirty_lots.values()])
+        for code in dirty_items:
+            self.versions[code] += 1
+        bulk_set(Item, ['stock', 'balance', 'version', 'updated_at'],
+                 [(code, self.stocks[code].stock, self.stocks[code].balance, self.versions[code], now)
+                  for code in dirty_items])
+
+        if backdated:
+            self.recost(backdated, date.fromordinal(min(first_lines[code][0] for code in backdated)), changes)
+        ChangeLog.objects.bulk_create([change for _, change in changes])
+        self.written[ChangeLog] += len(changes)
+        transaction.on_commit(notify, using=router.db_for_write(ChangeLog))
+
+    def recost(self, codes, since, changes):
+        """
+        Replay back-dated items in date order from `since`, and take the cost
+        of their new lines and their stock and balance from the replay.
+        """
+        items = {item.code: item for item in Item.objects.filter(code__in=codes)}
+        movements = recost(list(items.values()), since)
+        for code in codes:
+            # The open lots and the version changed, load them again.
+            del self.stocks[code]
+        for detail, change in changes:
+            if change.item_id in items:
+                item = items[change.item_id]
+                change.cost = movements[item.code][change.kind, detail.pk].cost
+                change.stock, change.balance = item.stock, item.balance
+
+    def load_items(self, codes):
+        codes = codes - self.stocks.keys()
+        if not codes:
+            return
+
+        found = {
+            code: (stock, balance, version)
+            for code, stock, balance, version
+            in Item.objects.filter(code__in=codes).values_list('code', 'stock', 'balance', 'version')
+        }
+        missing = codes - found.keys()
+        if missing and not self.create_items:
+            raise ValidationError(f"Unknown items: {', '.join(sorted(missing)[:10])}")
+        if missing:
+            Item.objects.bulk_create([Item(code=code, name=code, unit='unit') for code in sorted(missing)])
+            self.written[Item] += len(missing)
+
+        lots = {code: [] for code in codes}
+        open_lots = (
+            PurchaseDetail.objects
+            .filter(item_id__in=found.keys(), remaining_quantity__gt=0, is_deleted=False)
+            .order_by('header__date', 'pk')
+            .only('pk', 'item_id', 'unit_price', 'remaining_quantity')
+        )
+        for lot in open_lots:
+            lots[lot.item_id].append(lot)
+
+        for code in codes:
+            stock, balance, self.versions[code] = found.get(code, (Decimal('0'), Decimal('0'), 0))
+            self.stocks[code] = ItemStock(stock, balance, lots[code])
+
+    def new_headers(self, batch):
+        """
+        Headers of the batch that are not in the database yet. Every line of
+        a header must carry its date: the ledger dates a movement by its line.
+        """
+        headers = {PurchaseHeader: {}, SellHeader: {}}
+        locations = {}
+        for day, kind, _, location, code, _, _, _, description in batch:
+            model = PurchaseHeader if kind == PURCHASE else SellHeader
+            header = headers[model].get(code)
+            if header is None:
+                headers[model][code] = model(code=code, date=date.fromordinal(day), description=description)
+                locations[model, code] = location
+            elif header.date.toordinal() != day:
+                raise ValidationError(f"{location}: {code} is dated {header.date} on an earlier line, "
+                                      f"not {date.fromordinal(day)}.")
+
+        for model, pending in headers.items():
+            existing = model.objects.filter(code__in=pending.keys()).values_list('code', 'date')
+            for code, day in existing:
+                if day != pending[code].date:
+                    raise ValidationError(f"{locations[model, code]}: {code} already exists dated {day}, "
+                                          f"not {pending[code].date}.")
+                del pending[code]
+        return {model: list(pending.values()) for model, pending in headers.items()}
+
+
+def bulk_set(model, fields, rows):
+    """
+    `UPDATE ... WHERE pk = %s` for every `(pk, *values)` in `rows` with a
+    single `executemany`, cheaper than `bulk_update`'s CASE expressions.
+    """
+    if not rows:
+        return
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    model_fields = [model._meta.get_field(name) for name in fields]
+    assignments = ', '.join(f'{quote(field.column)} = %s' for field in model_fields)
+    sql = f'UPDATE {quote(model._meta.db_table)} SET {assignments} WHERE {quote(model._meta.pk.column)} = %s'
+    params = [
+        [field.get_db_prep_save(value, connection) for field, value in zip(model_fields, values)] + [pk]
+        for pk, *values in rows
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
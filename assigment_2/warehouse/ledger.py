@@ -0,0 +1,267 @@
+"""
+Point-in-time stock and value from the `StockMovement` ledger.
+
+Every purchase and sell line appends a movement with the item's cumulative
+quantity and cost after it, ordered by (date, id). The stock and FIFO value
+of an item on a date is the cumulative pair of its last movement on or
+before that date: a single lookup on the (item, date, id) index, however
+long the history is.
+
+Sales are costed in date order, purchases first on the same date, as in the
+stock card. A line dated before existing movements changes the cost of the
+sales after it, so `recost()` replays the item's lines from that date on and
+rewrites its movements from that date, the remaining quantity of the lots
+involved and `Item.stock` and `Item.balance`. The FIFO state at the start of
+the replay is the ledger position of the day before and the newest lots
+that make up its quantity, so the work grows with the rewritten period, not
+with the item's history.
+
+`check()` replays the purchase and sell lines through the in-memory FIFO
+and compares the end-of-day positions with the ledger; `rebuild()` writes
+the replay into the ledger, e.g. for data that predates it.
+"""
+import heapq
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from core.sharding import shard_querysets
+from .fifo import ItemStock
+from .models import Item, PurchaseDetail, PurchaseHeader, SellDetail, StockMovement
+
+ZERO = Decimal('0')
+
+
+def position(item, as_of):
+    """Stock and FIFO value of `item` at the end of `as_of`."""
+    row = (
+        StockMovement.objects.using(item._state.db)
+        .filter(item=item, date__lte=as_of)
+        .order_by('-date', '-id')
+        .values_list('cumulative_quantity', 'cumulative_cost')
+        .first()
+    )
+    return row or (ZERO, ZERO)
+
+
+def header_moved(header, old_date):
+    """Follow a header date change in the ledger of every item on it."""
+    kind = StockMovement.PURCHASE if isinstance(header, PurchaseHeader) else StockMovement.SELL
+    for movements in shard_querysets(StockMovement.objects.filter(kind=kind, reference=header.code)):
+        codes = list(movements.values_list('item_id', flat=True).distinct())
+        if codes:
+            recost(list(Item.objects.using(movements.db).filter(code__in=codes)), min(header.date, old_date))
+
+
+def replay(purchases, sells, stock=None):
+    """
+    Replay one item from its purchase rows `(date, pk, code, quantity,
+    unit_price)` and sell rows `(date, pk, code, quantity)`, both in date
+    order, with the cost of each sale taken from the FIFO. Purchases go first
+    on the same date, as in the stock card. The replay starts from `stock`,
+    an `ItemStock`, or from nothing.
+
+    Yields `(line, movement)` pairs, `line` being an unsaved detail with the
+    pk of its row. Purchase lines end with their remaining quantity once the
+    replay is exhausted.
+    """
+    if stock is None:
+        stock = ItemStock()
+    merged = heapq.merge(
+        ((row[0], 0, row) for row in purchases),
+        ((row[0], 1, row) for row in sells),
+        key=lambda entry: entry[:2],
+    )
+    for day, order, row in merged:
+        if order == 0:
+            _, pk, code, quantity, unit_price = row
+            line = PurchaseDetail(pk=pk, quantity=quantity, unit_price=unit_price)
+            stock.purchase(line)
+            yield line, StockMovement(date=day, kind=StockMovement.PURCHASE, reference=code,
+                                      quantity=quantity, cost=quantity * unit_price,
+                                      cumulative_quantity=stock.stock, cumulative_cost=stock.balance)
+        else:
+            _, pk, code, quantity = row
+            cost, _ = stock.sell(quantity)
+            yield SellDetail(pk=pk, quantity=quantity), StockMovement(
+                date=day, kind=StockMovement.SELL, reference=code,
+                quantity=-quantity, cost=-cost,
+                cumulative_quantity=stock.stock, cumulative_cost=stock.balance,
+            )
+
+
+def end_of_day(movements):
+    return {day: (quantity, cost) for day, quantity, cost in movements}
+
+
+def load_lines(codes, using, movements=True, since=None):
+    lines = {code: ([], [], []) for code in codes}
+    dated = {'header__date__gte': since} if since else {}
+    purchases = (
+        PurchaseDetail.objects.using(using)
+        .filter(item_id__in=codes, is_deleted=False, **dated)
+        .order_by('header__date', 'pk')
+        .values_list('item_id', 'header__date', 'pk', 'header__code', 'quantity', 'unit_price')
+    )
+    sells = (
+        SellDetail.objects.using(using)
+        .filter(item_id__in=codes, is_deleted=False, **dated)
+        .order_by('header__date', 'pk')
+        .values_list('item_id', 'header__date', 'pk', 'header__code', 'quantity')
+    )
+    querysets = [purchases, sells]
+    if movements:
+        querysets.append(
+            StockMovement.objects.using(using)
+            .filter(item_id__in=codes)
+            .order_by('date', 'id')
+            .values_list('item_id', 'date', 'cumulative_quantity', 'cumulative_cost')
+        )
+    for index, rows in enumerate(querysets):
+        for code, *row in rows.iterator():
+            lines[code][index].append(row)
+    return lines
+
+
+def check_items(items, using):
+    lines = load_lines([item.code for item in items], using)
+    for item in items:
+        purchases, sells, movements = lines[item.code]
+        try:
+            expected = end_of_day(
+                (movement.date, movement.cumulative_quantity, movement.cumulative_cost)
+                for _, movement in replay(purchases, sells)
+            )
+        except Exception as exc:
+            yield item, f'replay failed: {exc}'
+            continue
+
+        actual = end_of_day(movements)
+        for day in sorted(expected.keys() | actual.keys()):
+            if expected.get(day) != actual.get(day):
+                yield item, f'{day}: ledger {describe(actual.get(day))}, replay {describe(expected.get(day))}'
+                break
+        else:
+            final = actual[max(actual)] if actual else (ZERO, ZERO)
+            if final != (item.stock, item.balance):
+                yield item, f'ledger ends at {describe(final)}, item has {describe((item.stock, item.balance))}'
+
+
+def describe(position):
+    if position is None:
+        return 'no movement'
+    return f'{position[0]:.2f} worth {position[1]:.2f}'
+
+
+def check(items, chunk_size=500):
+    """
+    Yield `(item, message)` for every item whose ledger disagrees with a
+    FIFO replay of its lines, or ends somewhere else than `Item.stock` and
+    `Item.balance`. Items are processed `chunk_size` at a time.
+    """
+    for queryset in shard_querysets(items.order_by('code')):
+        chunk = []
+        for item in queryset.iterator(chunk_size=chunk_size):
+            chunk.append(item)
+            if len(chunk) == chunk_size:
+                yield from check_items(chunk, queryset.db)
+                chunk = []
+        yield from check_items(chunk, queryset.db)
+
+
+def final_position(movements):
+    if not movements:
+        return ZERO, ZERO
+    return movements[-1].cumulative_quantity, movements[-1].cumulative_cost
+
+
+def opening_stock(item, since):
+    """
+    FIFO state of `item` at the end of the day before `since`: its ledger
+    position then, and the newest lots before `since` that make up the
+    quantity, FIFO having sold the older ones.
+    """
+    quantity, cost = position(item, since - timedelta(days=1))
+    lots = []
+    covered = ZERO
+    rows = (
+        PurchaseDetail.objects.using(item._state.db)
+        .filter(item=item, is_deleted=False, header__date__lt=since)
+        .order_by('-header__date', '-pk')
+        .values_list('pk', 'quantity', 'unit_price')
+    )
+    for pk, lot_quantity, unit_price in rows.iterator():
+        if covered >= quantity:
+            break
+        remaining = min(lot_quantity, quantity - covered)
+        lots.append(PurchaseDetail(pk=pk, quantity=lot_quantity, unit_price=unit_price, remaining_quantity=remaining))
+        covered += remaining
+    return ItemStock(quantity, cost, reversed(lots))
+
+
+def write_replay(item, lines, final, since=None, lots=()):
+    """
+    Replace the ledger of `item`, from `since` on if given, with the replayed
+    `(line, movement)` pairs, save the remaining quantity of its replayed
+    purchase lines and of `lots`, set its stock and balance to `final` and
+    bump its version.
+    """
+    using = item._state.db
+    movements = [movement for _, movement in lines]
+    for movement in movements:
+        movement.item = item
+    now = timezone.now()
+    lots = list(lots) + [line for line, _ in lines if isinstance(line, PurchaseDetail)]
+    for lot in lots:
+        lot.updated_at = now
+    replaced = StockMovement.objects.using(using).filter(item=item)
+    if since:
+        replaced = replaced.filter(date__gte=since)
+    with transaction.atomic(using=using):
+        replaced.delete()
+        StockMovement.objects.using(using).bulk_create(movements, batch_size=1000)
+        PurchaseDetail.objects.using(using).bulk_update(lots, ['remaining_quantity', 'updated_at'], batch_size=1000)
+        item.stock, item.balance = final
+        item.version += 1
+        Item.objects.using(using).filter(pk=item.pk).update(stock=item.stock, balance=item.balance,
+                                                            version=item.version, updated_at=now)
+    return movements
+
+
+def recost(items, since):
+    """
+    Replay the lines of `items`, all on one database, in date order from
+    `since` on and write the result, see `write_replay()`. Returns the
+    movement of every replayed line by item code and `(kind, pk)`. Raises
+    `ValidationError` when a sale exceeds the stock on its date.
+    """
+    lines = load_lines([item.code for item in items], items[0]._state.db, movements=False, since=since)
+    movements = {}
+    for item in items:
+        purchases, sells, _ = lines[item.code]
+        stock = opening_stock(item, since)
+        opening = list(stock.lots)
+        try:
+            replayed = list(replay(purchases, sells, stock))
+        except ValidationError as exc:
+            raise ValidationError(f'{item.code}: {exc.messages[0]}')
+        write_replay(item, replayed, (stock.stock, stock.balance), since, opening)
+        movements[item.code] = {(movement.kind, line.pk): movement for line, movement in replayed}
+    return movements
+
+
+def rebuild(item):
+    """
+    Replace the ledger of `item` with the movements of a FIFO replay. Refuses
+    with `ValidationError`, writing nothing, when the replay does not end at
+    `Item.stock` and `Item.balance`: the lines themselves are then in doubt.
+    """
+    purchases, sells, _ = load_lines([item.code], item._state.db)[item.code]
+    lines = list(replay(purchases, sells))
+    final = final_position([movement for _, movement in lines])
+    if final != (item.stock, item.balance):
+        raise ValidationError(f'replay ends at {describe(final)}, item has {describe((item.stock, item.balance))}')
+    return len(write_replay(item, lines, final))
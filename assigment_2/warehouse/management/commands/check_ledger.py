@@ -0,0 +1,45 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from warehouse.ledger import check, rebuild
+from warehouse.models import Item
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the stock movement ledger of every item with a full FIFO replay of its purchase '
+        'and sell lines, and with Item.stock and Item.balance.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', help='Comma-separated item codes, defaults to all items.')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Items checked per set of queries.')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Rewrite the ledger of items that differ from the replay, unless the replay '
+                                 'ends elsewhere than Item.stock and Item.balance.')
+
+    def handle(self, *args, **options):
+        items = Item.objects.all()
+        if options['items']:
+            items = items.filter(code__in=[code.strip() for code in options['items'].split(',') if code.strip()])
+
+        failed = refused = 0
+        for item, message in check(items, chunk_size=options['chunk_size']):
+            failed += 1
+            if options['rebuild']:
+                try:
+                    message += f'; rebuilt {rebuild(item)} movements'
+                except ValidationError as exc:
+                    refused += 1
+                    message += f'; not rebuilt, {exc.messages[0]}'
+            self.stdout.write(f'{item.code}: {message}')
+
+        if failed and not options['rebuild']:
+            raise CommandError(f'{failed} items have a ledger that does not match the FIFO replay.')
+        if refused:
+            raise CommandError(f'{refused} items were not rebuilt: their replay does not end at their stock '
+                               f'and balance.')
+        if failed:
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt the ledger of {failed} items.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Ledger matches the FIFO replay.'))
@@ -0,0 +1,54 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.sharding import shard_aliases
+from warehouse.generator import DatasetGenerator
+from warehouse.models import Item, PurchaseHeader, PurchaseDetail, SellHeader, SellDetail, StockMovement, ChangeLog
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic, FIFO-consistent warehouse dataset directly into the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=100)
+        parser.add_argument('--orders', type=int, default=100, help='Purchase and sell orders in total.')
+        parser.add_argument('--lines', type=int, default=3, help='Lines per order.')
+        parser.add_argument('--start-date', type=date.fromisoformat, default=date(2024, 1, 1))
+        parser.add_argument('--days', type=int, default=365, help='Spread order dates over this many days.')
+        parser.add_argument('--purchase-ratio', type=float, default=0.5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--flush', action='store_true', help='Delete existing warehouse data first.')
+
+    def handle(self, *args, **options):
+        if shard_aliases():
+            # Every row would land on the default database, where the API
+            # does not look for sharded items.
+            raise CommandError('generate_data writes to a single database and does not support WAREHOUSE_SHARDS.')
+        if options['items'] < 1:
+            raise CommandError('--items must be at least 1.')
+
+        if options['flush']:
+            for model in (ChangeLog, StockMovement, SellDetail, PurchaseDetail, SellHeader, PurchaseHeader, Item):
+                model.objects.all().delete()
+        elif Item.objects.exists():
+            raise CommandError('The database already has items, use --flush to replace them.')
+
+        started = time.perf_counter()
+        written = DatasetGenerator(
+            items=options['items'],
+            orders=options['orders'],
+            lines=options['lines'],
+            start_date=options['start_date'],
+            days=options['days'],
+            purchase_ratio=options['purchase_ratio'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            stdout=self.stdout if options['verbosity'] > 1 else None,
+        ).run()
+        elapsed = time.perf_counter() - started
+
+        summary = ', '.join(f'{count} {model.__name__}' for model, count in written.items())
+        self.stdout.write(self.style.SUCCESS(f'Generated {summary} in {elapsed:.1f}s'))
@@ -0,0 +1,82 @@
+import time
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from core.sharding import shard_aliases
+from warehouse.importer import COLUMNS, TransactionImporter, sorted_rows
+from warehouse.models import ImportCheckpoint
+
+
+class Command(BaseCommand):
+    help = (
+        'Import historical purchase and sell lines from CSV or NDJSON files. '
+        f'Each line has the fields: {", ".join(COLUMNS)} (unit_price only for purchases). '
+        'Lines are sorted by date and FIFO is applied in memory per item.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help='CSV or NDJSON (.ndjson/.jsonl) files.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Lines committed per transaction.')
+        parser.add_argument('--sort-buffer', type=int, default=250000,
+                            help='Lines sorted in memory before spilling to a temporary file.')
+        parser.add_argument('--create-items', action='store_true', help='Create items that do not exist yet.')
+        parser.add_argument('--checkpoint', help='Name of the checkpoint, defaults to the path of the first file.')
+        parser.add_argument('--resume', action='store_true', help='Continue after the last checkpoint.')
+
+    def handle(self, *args, **options):
+        if shard_aliases():
+            # Every row would land on the default database, where the API
+            # does not look for sharded items.
+            raise CommandError('import_transactions writes to a single database and does not support WAREHOUSE_SHARDS.')
+        files = [Path(name) for name in options['files']]
+        for path in files:
+            if not path.is_file():
+                raise CommandError(f'{path} does not exist.')
+
+        name = options['checkpoint'] or str(files[0].resolve())
+        fingerprint = [[str(path.resolve()), path.stat().st_size, path.stat().st_mtime_ns] for path in files]
+        skip = self.load_state(name, fingerprint, options['resume'])
+
+        def checkpoint(done):
+            # Runs inside the transaction of the batch it records.
+            ImportCheckpoint.objects.update_or_create(name=name, defaults={'files': fingerprint, 'done': done})
+
+        started = time.perf_counter()
+        try:
+            total, rows = sorted_rows(files, options['sort_buffer'])
+            self.stdout.write(f'Sorted {total} lines in {time.perf_counter() - started:.1f}s')
+            if skip:
+                self.stdout.write(f'Resuming after line {skip}')
+
+            importer = TransactionImporter(
+                batch_size=options['batch_size'],
+                create_items=options['create_items'],
+                stdout=self.stdout if options['verbosity'] > 0 else None,
+            )
+            written = importer.run(rows, total, skip=skip, checkpoint=checkpoint)
+        except ValidationError as exc:
+            raise CommandError('; '.join(exc.messages))
+
+        ImportCheckpoint.objects.filter(name=name).delete()
+        summary = ', '.join(f'{count} {model.__name__}' for model, count in written.items())
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {summary} in {time.perf_counter() - started:.1f}s'
+        ))
+
+    def load_state(self, name, fingerprint, resume):
+        state = ImportCheckpoint.objects.filter(name=name).first()
+        if state is None:
+            if resume:
+                raise CommandError(f'Nothing to resume, there is no checkpoint {name!r}.')
+            return 0
+
+        if not resume:
+            raise CommandError(
+                f'Checkpoint {name!r} exists from an interrupted import after {state.done} lines. '
+                'Pass --resume to continue it or delete the checkpoint to start over.'
+            )
+        if state.files != fingerprint:
+            raise CommandError(f'The input files changed since checkpoint {name!r} was written.')
+        return state.done
@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.replicas import sync_replica
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into every alias in DATABASE_REPLICAS.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep syncing every INTERVAL seconds instead of once.')
+
+    def handle(self, *args, **options):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if not replicas:
+            raise CommandError('DATABASE_REPLICAS is empty, nothing to sync.')
+
+        while True:
+            started = time.perf_counter()
+            for alias in replicas:
+                sync_replica(connections[DEFAULT_DB_ALIAS], connections[alias])
+            if options['verbosity'] > 1 or not options['interval']:
+                self.stdout.write(f'Synced {", ".join(replicas)} in {time.perf_counter() - started:.2f}s')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
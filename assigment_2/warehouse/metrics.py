@@ -0,0 +1,133 @@
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, labelvalues, amount=1):
+        with self.lock:
+            self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        for labelvalues, value in values:
+            yield self.name, list(zip(self.labelnames, labelvalues)), value
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labelvalues, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(labelvalues)
+            if state is None:
+                # Per-bucket counts plus the +Inf bucket, then the sum.
+                state = self.values[labelvalues] = [[0] * (len(self.buckets) + 1), 0]
+            state[0][index] += 1
+            state[1] += value
+
+    def samples(self):
+        with self.lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self.values.items())
+        for labelvalues, (counts, total) in values:
+            labels = list(zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield f'{self.name}_bucket', labels + [('le', _format_value(bound))], cumulative
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def clear(self):
+        for metric in self.metrics:
+            with metric.lock:
+                metric.values.clear()
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter(
+    'warehouse_requests_total', 'Requests served per view.',
+    ('view', 'method', 'status'),
+))
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    'warehouse_request_duration_seconds', 'Wall time spent in the view, in seconds.',
+    ('view', 'method'), DURATION_BUCKETS,
+))
+DB_QUERIES = REGISTRY.register(Histogram(
+    'warehouse_db_queries', 'Database queries executed per request.',
+    ('view', 'method'), QUERY_BUCKETS,
+))
+DB_DURATION = REGISTRY.register(Histogram(
+    'warehouse_db_duration_seconds', 'Time spent executing database queries per request, in seconds.',
+    ('view', 'method'), DURATION_BUCKETS,
+))
+
+
+def is_internal(request):
+    return request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS
+
+
+def metrics_view(request):
+    # Only for the scraper: view names and timings describe the deployment.
+    if not is_internal(request):
+        raise Http404
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
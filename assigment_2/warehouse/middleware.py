@@ -0,0 +1,120 @@
+import cProfile
+import contextvars
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+from .metrics import DB_DURATION, DB_QUERIES, REQUEST_DURATION, REQUESTS, is_internal
+
+# The recorder of the request being served. Context variables follow the
+# request into `sync_to_async` threads and into the body of a streaming
+# response, so every query of the request is counted wherever it runs.
+current_recorder = contextvars.ContextVar('warehouse_query_recorder', default=None)
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+def record_query(execute, sql, params, many, context):
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.duration += time.perf_counter() - started
+        recorder.count += 1
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """`connection_created` receiver adding `record_query` to every connection once."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class MetricsMiddleware:
+    """
+    Record wall time, query count and query time for every request, labelled
+    by the resolved view name, for the `/metrics/` endpoint.
+
+    Set `WAREHOUSE_PROFILE_DIR` to allow profiling: requests from one of
+    `INTERNAL_IPS` sent with the `X-Profile` header (or every request when
+    `WAREHOUSE_PROFILE_ALL` is set) run under `cProfile` and the stats are
+    dumped to that directory.
+
+    Streaming responses (exports, the change stream) are recorded when their
+    body has been sent, with the queries run while it was generated.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+
+        token = current_recorder.set(recorder)
+        try:
+            profile_dir = getattr(settings, 'WAREHOUSE_PROFILE_DIR', None)
+            profile_all = getattr(settings, 'WAREHOUSE_PROFILE_ALL', False)
+            if profile_dir and (profile_all or ('HTTP_X_PROFILE' in request.META and is_internal(request))):
+                response = self.profile(request, profile_dir)
+            else:
+                response = self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+
+        if response.streaming:
+            record = self.record_async if response.is_async else self.record_sync
+            response.streaming_content = record(response.streaming_content, request, response, recorder, started)
+        else:
+            self.record(request, response, recorder, started)
+        return response
+
+    def record_sync(self, content, request, response, recorder, started):
+        token = current_recorder.set(recorder)
+        try:
+            yield from content
+        finally:
+            current_recorder.reset(token)
+            self.record(request, response, recorder, started)
+
+    async def record_async(self, content, request, response, recorder, started):
+        token = current_recorder.set(recorder)
+        try:
+            async for chunk in content:
+                yield chunk
+        finally:
+            current_recorder.reset(token)
+            self.record(request, response, recorder, started)
+
+    def record(self, request, response, recorder, started):
+        elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        labels = (match.view_name if match else 'unmatched', request.method)
+
+        REQUESTS.inc(labels + (str(response.status_code),))
+        REQUEST_DURATION.observe(labels, elapsed)
+        DB_QUERIES.observe(labels, recorder.count)
+        DB_DURATION.observe(labels, recorder.duration)
+
+    def profile(self, request, profile_dir):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+
+        match = request.resolver_match
+        name = (match.view_name if match else 'unmatched').replace(':', '-')
+        path = Path(profile_dir) / f'{name}-{request.method}-{time.time_ns()}.prof'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(path)
+        response['X-Profile-File'] = path.name
+        return response
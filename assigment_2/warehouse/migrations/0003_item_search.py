@@ -0,0 +1,55 @@
+from django.db import migrations
+
+# External-content FTS5 index over Item.name and Item.description, kept in
+# sync by triggers so bulk_create, update() and raw SQL writes are covered
+# as well as Model.save(). Stock updates rewrite the whole row, so the
+# update trigger only reindexes when the text actually changed.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE warehouse_item_fts USING fts5(
+        name, description,
+        content='warehouse_item', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER warehouse_item_fts_insert AFTER INSERT ON warehouse_item BEGIN
+        INSERT INTO warehouse_item_fts (rowid, name, description)
+        VALUES (new.rowid, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER warehouse_item_fts_delete AFTER DELETE ON warehouse_item BEGIN
+        INSERT INTO warehouse_item_fts (warehouse_item_fts, rowid, name, description)
+        VALUES ('delete', old.rowid, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER warehouse_item_fts_update AFTER UPDATE OF name, description ON warehouse_item
+    WHEN old.name IS NOT new.name OR old.description IS NOT new.description BEGIN
+        INSERT INTO warehouse_item_fts (warehouse_item_fts, rowid, name, description)
+        VALUES ('delete', old.rowid, old.name, old.description);
+        INSERT INTO warehouse_item_fts (rowid, name, description)
+        VALUES (new.rowid, new.name, new.description);
+    END
+    """,
+    "INSERT INTO warehouse_item_fts (warehouse_item_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS warehouse_item_fts_update',
+    'DROP TRIGGER IF EXISTS warehouse_item_fts_delete',
+    'DROP TRIGGER IF EXISTS warehouse_item_fts_insert',
+    'DROP TABLE IF EXISTS warehouse_item_fts',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0002_item_version'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_SQL, DROP_SQL),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.20 on 2026-10-19 15:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0003_item_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('kind', models.CharField(choices=[('purchase', 'Purchase'), ('sell', 'Sell')], max_length=8)),
+                ('reference', models.CharField(max_length=50)),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('cost', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('cumulative_quantity', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('cumulative_cost', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='movements', to='warehouse.item')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['item', 'date', 'id'], name='movement_item_date_idx'), models.Index(fields=['kind', 'reference'], name='movement_reference_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.20 on 2026-10-19 15:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0004_stock_movement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('purchase', 'Purchase'), ('sell', 'Sell')], max_length=8)),
+                ('reference', models.CharField(max_length=50)),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('cost', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('stock', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='changes', to='warehouse.item')),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.20 on 2026-10-19 15:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0005_change_log'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['date', 'item', 'kind', 'quantity', 'cost'], name='movement_date_idx'),
+        ),
+    ]
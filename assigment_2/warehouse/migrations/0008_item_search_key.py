@@ -0,0 +1,83 @@
+from importlib import import_module
+
+from django.db import migrations
+
+# The index of 0003 used the implicit rowid of warehouse_item as its key,
+# which SQLite renumbers whenever it copies the table. The new index is
+# contentless and keyed by an integer assigned once per item code.
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS warehouse_item_fts_update',
+    'DROP TRIGGER IF EXISTS warehouse_item_fts_delete',
+    'DROP TRIGGER IF EXISTS warehouse_item_fts_insert',
+    'DROP TABLE IF EXISTS warehouse_item_fts',
+]
+
+CREATE_SQL = [
+    """
+    CREATE TABLE warehouse_item_search_key (
+        id integer NOT NULL PRIMARY KEY,
+        item_id varchar(50) NOT NULL UNIQUE
+    )
+    """,
+    """
+    CREATE VIRTUAL TABLE warehouse_item_fts USING fts5(
+        name, description, content='',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+]
+
+# Stock updates rewrite the whole row, so the update trigger only reindexes
+# when the text actually changed.
+TRIGGER_SQL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS warehouse_item_fts_insert AFTER INSERT ON warehouse_item BEGIN
+        INSERT OR IGNORE INTO warehouse_item_search_key (item_id) VALUES (new.code);
+        INSERT INTO warehouse_item_fts (rowid, name, description)
+        SELECT id, new.name, new.description FROM warehouse_item_search_key WHERE item_id = new.code;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS warehouse_item_fts_delete AFTER DELETE ON warehouse_item BEGIN
+        INSERT INTO warehouse_item_fts (warehouse_item_fts, rowid, name, description)
+        SELECT 'delete', id, old.name, old.description FROM warehouse_item_search_key WHERE item_id = old.code;
+        DELETE FROM warehouse_item_search_key WHERE item_id = old.code;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS warehouse_item_fts_update AFTER UPDATE OF name, description ON warehouse_item
+    WHEN old.name IS NOT new.name OR old.description IS NOT new.description BEGIN
+        INSERT INTO warehouse_item_fts (warehouse_item_fts, rowid, name, description)
+        SELECT 'delete', id, old.name, old.description FROM warehouse_item_search_key WHERE item_id = old.code;
+        INSERT INTO warehouse_item_fts (rowid, name, description)
+        SELECT id, new.name, new.description FROM warehouse_item_search_key WHERE item_id = new.code;
+    END
+    """,
+]
+
+REBUILD_SQL = [
+    'DELETE FROM warehouse_item_search_key WHERE item_id NOT IN (SELECT code FROM warehouse_item)',
+    'INSERT OR IGNORE INTO warehouse_item_search_key (item_id) SELECT code FROM warehouse_item',
+    "INSERT INTO warehouse_item_fts (warehouse_item_fts) VALUES ('delete-all')",
+    """
+    INSERT INTO warehouse_item_fts (rowid, name, description)
+    SELECT search_key.id, item.name, item.description
+    FROM warehouse_item_search_key AS search_key
+    JOIN warehouse_item AS item ON item.code = search_key.item_id
+    """,
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0007_import_checkpoint'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            DROP_SQL + CREATE_SQL + TRIGGER_SQL + REBUILD_SQL,
+            DROP_SQL + ['DROP TABLE IF EXISTS warehouse_item_search_key']
+            + import_module('warehouse.migrations.0003_item_search').CREATE_SQL,
+        ),
+    ]
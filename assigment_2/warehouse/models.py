@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from decimal import Decimal
@@ -20,6 +20,8 @@ class Item(BaseModel):
     description = models.TextField(blank=True, null=True)
     stock = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    # Bumped on every stock movement of the item; part of the report ETag.
+    version = models.PositiveBigIntegerField(default=0)
 
     def __str__(self):
         return f"{self.code} - {self.name}"
@@ -32,6 +34,7 @@ class Item(BaseModel):
 
     class Meta:
         ordering = ['code']
+        indexes = [models.Index(fields=['updated_at'], name='item_updated_at_idx')]
 
 
 class PurchaseHeader(BaseModel):
@@ -60,12 +63,20 @@ class PurchaseDetail(BaseModel):
             raise ValidationError("Unit price must be positive.")
 
     def save(self, *args, **kwargs):
-        if not self.pk:  # Only on creation
-            self.remaining_quantity = self.quantity
-            self.item.stock += self.quantity
-            self.item.balance += (self.quantity * self.unit_price)
-            self.item.save()
-        super().save(*args, **kwargs)
+        with transaction.atomic(using=self.item._state.db):
+            if not self.pk and StockMovement.is_backdated(self.item, StockMovement.PURCHASE, self.header):
+                self.remaining_quantity = self.quantity
+                StockMovement.recost(self, *args, **kwargs)
+                return
+            if not self.pk:  # Only on creation
+                self.remaining_quantity = self.quantity
+                self.item.stock += self.quantity
+                self.item.balance += (self.quantity * self.unit_price)
+                self.item.version += 1
+                self.item.save()
+                StockMovement.record(self.item, StockMovement.PURCHASE, self.header,
+                                     self.quantity, self.quantity * self.unit_price)
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Purchase Detail {self.header.code} - {self.item.code}"
@@ -95,38 +106,167 @@ class SellDetail(BaseModel):
             raise ValidationError("Insufficient stock available.")
 
     def save(self, *args, **kwargs):
-        if not self.pk:  # Only on creation
-            remaining_to_sell = self.quantity
-            total_cost = Decimal('0.0')
+        # An oversell raises after lots were drawn down; they roll back with it.
+        with transaction.atomic(using=self.item._state.db):
+            if not self.pk and StockMovement.is_backdated(self.item, StockMovement.SELL, self.header):
+                StockMovement.recost(self, *args, **kwargs)
+                return
+            if not self.pk:  # Only on creation
+                remaining_to_sell = self.quantity
+                total_cost = Decimal('0.0')
 
-            # Get available purchase details with remaining quantity, ordered by date (FIFO)
-            purchase_details = PurchaseDetail.objects.filter(
-                item=self.item,
-                remaining_quantity__gt=0,
-                is_deleted=False
-            ).order_by('header__date')
+                # Get available purchase details with remaining quantity, ordered by date (FIFO)
+                purchase_details = self.item.purchase_details.filter(
+                    remaining_quantity__gt=0,
+                    is_deleted=False
+                ).order_by('header__date', 'pk')
 
-            for purchase in purchase_details:
-                if remaining_to_sell <= 0:
-                    break
+                for purchase in purchase_details:
+                    if remaining_to_sell <= 0:
+                        break
 
-                quantity_from_purchase = min(remaining_to_sell, purchase.remaining_quantity)
-                cost = (quantity_from_purchase * purchase.unit_price)
-                total_cost += cost
+                    quantity_from_purchase = min(remaining_to_sell, purchase.remaining_quantity)
+                    cost = (quantity_from_purchase * purchase.unit_price)
+                    total_cost += cost
 
-                purchase.remaining_quantity -= quantity_from_purchase
-                purchase.save()
+                    purchase.remaining_quantity -= quantity_from_purchase
+                    purchase.save()
 
-                remaining_to_sell -= quantity_from_purchase
+                    remaining_to_sell -= quantity_from_purchase
 
-            if remaining_to_sell > 0:
-                raise ValidationError("Insufficient stock available.")
+                if remaining_to_sell > 0:
+                    raise ValidationError("Insufficient stock available.")
 
-            self.item.stock -= self.quantity
-            self.item.balance -= total_cost
-            self.item.save()
+                self.item.stock -= self.quantity
+                self.item.balance -= total_cost
+                self.item.version += 1
+                self.item.save()
+                StockMovement.record(self.item, StockMovement.SELL, self.header, -self.quantity, -total_cost)
 
-        super().save(*args, **kwargs)
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Sale Detail {self.header.code} - {self.item.code}"
+
+
+class StockMovement(models.Model):
+    """
+    Ledger with one row per purchase or sell line. Quantity and cost are
+    signed; the cumulative columns hold the item's stock and FIFO value after
+    the movement, in (date, id) order. A line is appended, unless it is dated
+    before existing movements of its item or its header date changes: then
+    the item's rows from that date on are rewritten. See warehouse/ledger.py.
+    """
+    PURCHASE = 'purchase'
+    SELL = 'sell'
+    KIND_CHOICES = [(PURCHASE, 'Purchase'), (SELL, 'Sell')]
+
+    item = models.ForeignKey(Item, on_delete=models.PROTECT, related_name='movements')
+    date = models.DateField()
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES)
+    reference = models.CharField(max_length=50)
+    quantity = models.DecimalField(max_digits=15, decimal_places=2)
+    cost = models.DecimalField(max_digits=15, decimal_places=2)
+    cumulative_quantity = models.DecimalField(max_digits=15, decimal_places=2)
+    cumulative_cost = models.DecimalField(max_digits=15, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['item', 'date', 'id'], name='movement_item_date_idx'),
+            models.Index(fields=['kind', 'reference'], name='movement_reference_idx'),
+            # Covers the date range scans of warehouse/analytics.py.
+            models.Index(fields=['date', 'item', 'kind', 'quantity', 'cost'], name='movement_date_idx'),
+        ]
+
+    @classmethod
+    def record(cls, item, kind, header, quantity, cost):
+        previous = cls.objects.db_manager(item._state.db).filter(item=item).order_by('-date', '-id').values_list(
+            'cumulative_quantity', 'cumulative_cost'
+        ).first() or (Decimal('0'), Decimal('0'))
+        movement = cls.objects.db_manager(item._state.db).create(
+            item=item, date=header.date, kind=kind, reference=header.code,
+            quantity=quantity, cost=cost,
+            cumulative_quantity=previous[0] + quantity,
+            cumulative_cost=previous[1] + cost,
+        )
+        ChangeLog.record(movement)
+        return movement
+
+    @classmethod
+    def is_backdated(cls, item, kind, header):
+        """
+        Whether a new line of `header` goes before existing movements of
+        `item` in date order, where purchases go first on the same date.
+        """
+        later = models.Q(date__gt=header.date)
+        if kind == cls.PURCHASE:
+            later |= models.Q(date=header.date, kind=cls.SELL)
+        return cls.objects.db_manager(item._state.db).filter(later, item=item).exists()
+
+    @classmethod
+    def recost(cls, detail, *args, **kwargs):
+        """
+        Save a back-dated `detail` and replay the lines of its item in date
+        order, which moves the FIFO cost of the sales after it. See
+        `ledger.recost`.
+        """
+        from .ledger import recost
+
+        item = detail.item
+        with transaction.atomic(using=item._state.db):
+            models.Model.save(detail, *args, **kwargs)
+            kind = cls.PURCHASE if isinstance(detail, PurchaseDetail) else cls.SELL
+            ChangeLog.record(recost([item], detail.header.date)[item.code][kind, detail.pk])
+
+    def __str__(self):
+        return f"{self.kind} {self.reference} - {self.item_id}"
+
+
+class ChangeLog(models.Model):
+    """
+    Change feed for downstream systems: one row per new purchase or sell
+    line, written in the same transaction and never updated, with the item's
+    stock and balance right after it. `id` is the sequence number consumers
+    resume from. See warehouse/changes.py.
+    """
+    item = models.ForeignKey(Item, on_delete=models.PROTECT, related_name='changes')
+    kind = models.CharField(max_length=8, choices=StockMovement.KIND_CHOICES)
+    reference = models.CharField(max_length=50)
+    quantity = models.DecimalField(max_digits=15, decimal_places=2)
+    cost = models.DecimalField(max_digits=15, decimal_places=2)
+    stock = models.DecimalField(max_digits=15, decimal_places=2)
+    balance = models.DecimalField(max_digits=15, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def record(cls, movement):
+        from .changes import notify
+
+        item = movement.item
+        using = item._state.db
+        change = cls.objects.db_manager(using).create(
+            item=item, kind=movement.kind, reference=movement.reference,
+            quantity=movement.quantity, cost=movement.cost,
+            stock=item.stock, balance=item.balance,
+        )
+        transaction.on_commit(notify, using=using)
+        return change
+
+    def __str__(self):
+        return f"#{self.id} {self.kind} {self.reference} - {self.item_id}"
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Progress of an `import_transactions` run: the number of sorted lines
+    committed so far. Written in the transaction of each batch, so a resumed
+    import never repeats or skips a batch.
+    """
+    name = models.CharField(max_length=255, primary_key=True)
+    files = models.JSONField()
+    done = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.done} lines"
@@ -0,0 +1,65 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    `JSONRenderer` backed by `orjson` when it is installed.
+
+    Only compact, non-indented output goes through `orjson`, and values it
+    cannot encode natively (dates, decimals, lazy strings) are handed to the
+    regular DRF encoder, so the bytes match `JSONRenderer`. Without `orjson`
+    this is exactly `JSONRenderer`.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(
+            data,
+            default=self.encoder_class().default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Selects the CSV export through `?format=csv` or `Accept: text/csv`.
+    Exports themselves are streamed by the views, so this only renders
+    error payloads.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        from .exports import csv_stream
+
+        if data is None:
+            return b''
+        rows = data.items() if isinstance(data, dict) else [('detail', data)]
+        return b''.join(csv_stream(['field', 'message'], rows))
+
+
+class XLSXRenderer(BaseRenderer):
+    media_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    format = 'xlsx'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        from .exports import xlsx_stream
+
+        if data is None:
+            return b''
+        rows = data.items() if isinstance(data, dict) else [('detail', data)]
+        return b''.join(xlsx_stream(['field', 'message'], rows))
@@ -0,0 +1,167 @@
+import heapq
+from datetime import datetime
+from decimal import Decimal
+
+from django.utils.timezone import make_aware
+
+from .models import PurchaseDetail, SellDetail
+
+ENTRY_FIELDS = [
+    'date', 'description', 'code',
+    'in_qty', 'in_price', 'in_total',
+    'out_qty', 'out_price', 'out_total',
+    'stock_qty', 'stock_price', 'stock_total',
+    'balance_qty', 'balance',
+]
+
+
+def parse_date(value):
+    if not value:
+        return None
+    return make_aware(datetime.strptime(value, '%Y-%m-%d'))
+
+
+class StockCard:
+    """
+    FIFO stock card of one item.
+
+    Iterating yields the report entries one at a time, reading the purchase
+    and sell details with two date-ordered cursors, so a caller can stream
+    them out without building the whole report first. `summary()` is
+    available once the iteration is finished.
+    """
+
+    def __init__(self, item, start_date=None, end_date=None):
+        self.item = item
+        self.start_date = start_date
+        self.end_date = end_date
+        self.running_stock = []
+        self.total_in_qty = Decimal('0')
+        self.total_out_qty = Decimal('0')
+
+    def transactions(self):
+        date_range = (self.start_date, self.end_date) if self.start_date and self.end_date else (None, None)
+        # Read from the database the item came from: its shard, or the
+        # replica it was loaded from, also when the rows are streamed later.
+        using = self.item._state.db
+        purchases = PurchaseDetail.objects.using(using).filter(
+            item=self.item,
+            is_deleted=False,
+            header__date__range=date_range
+        ).order_by('header__date', 'pk').values_list(
+            'header__date', 'header__description', 'header__code',
+            'quantity', 'unit_price'
+        )
+        sells = SellDetail.objects.using(using).filter(
+            item=self.item,
+            is_deleted=False,
+            header__date__range=date_range
+        ).order_by('header__date', 'pk').values_list(
+            'header__date', 'header__description', 'header__code', 'quantity'
+        )
+
+        # heapq.merge keeps purchases ahead of sells on the same date, like
+        # the stable sort over "purchases, then sells" it replaces.
+        return heapq.merge(
+            ((row, 'purchase') for row in purchases.iterator()),
+            ((row, 'sell') for row in sells.iterator()),
+            key=lambda trans: trans[0][0],
+        )
+
+    def __iter__(self):
+        for row, kind in self.transactions():
+            if kind == 'purchase':
+                yield self.purchase(*row)
+            else:
+                yield self.sell(*row)
+
+    def purchase(self, date, description, code, quantity, unit_price):
+        # The card replays every sale itself, so a lot starts out full rather
+        # than at its current `remaining_quantity`.
+        self.running_stock.append({
+            'quantity': quantity,
+            'price': unit_price,
+            'remaining': quantity
+        })
+        self.total_in_qty += quantity
+        return self.entry(date, description, code,
+                          in_qty=int(quantity),
+                          in_price=int(unit_price),
+                          in_total=int(quantity * unit_price))
+
+    def sell(self, date, description, code, out_qty):
+        out_total = Decimal('0')
+        out_price = Decimal('0')
+
+        # Process FIFO for selling
+        remaining_to_sell = out_qty
+        for stock in self.running_stock:
+            if remaining_to_sell <= 0:
+                break
+
+            available = stock['remaining']
+            if available > 0:
+                sold = min(remaining_to_sell, available)
+                stock['remaining'] -= sold
+                out_total += sold * stock['price']
+                remaining_to_sell -= sold
+
+        if out_qty > 0:
+            out_price = out_total / out_qty
+
+        self.total_out_qty += out_qty
+        return self.entry(date, description, code,
+                          out_qty=int(out_qty),
+                          out_price=int(out_price),
+                          out_total=int(out_total))
+
+    def entry(self, date, description, code, in_qty=0, in_price=0, in_total=0,
+              out_qty=0, out_price=0, out_total=0):
+        stock_qty = [entry['remaining'] for entry in self.running_stock]
+        stock_price = [entry['price'] for entry in self.running_stock]
+        stock_total = [qty * price for qty, price in zip(stock_qty, stock_price)]
+
+        return {
+            'date': date.strftime('%d-%m-%Y'),
+            'description': description or '',
+            'code': code,
+            'in_qty': in_qty,
+            'in_price': in_price,
+            'in_total': in_total,
+            'out_qty': out_qty,
+            'out_price': out_price,
+            'out_total': out_total,
+            'stock_qty': [int(qty) for qty in stock_qty],
+            'stock_price': [int(price) for price in stock_price],
+            'stock_total': [int(total) for total in stock_total],
+            'balance_qty': int(sum(stock_qty)),
+            'balance': int(sum(stock_total))
+        }
+
+    def summary(self):
+        return {
+            'in_qty': int(self.total_in_qty),
+            'out_qty': int(self.total_out_qty),
+            'balance_qty': int(self.total_in_qty - self.total_out_qty),
+            'balance': int(sum(entry['remaining'] * entry['price'] for entry in self.running_stock))
+        }
+
+    def rows(self):
+        for entry in self:
+            yield [entry[field] for field in ENTRY_FIELDS]
+        summary = self.summary()
+        yield [None, 'Summary', None,
+               summary['in_qty'], None, None,
+               summary['out_qty'], None, None,
+               None, None, None,
+               summary['balance_qty'], summary['balance']]
+
+    def as_dict(self):
+        items = list(self)
+        return {
+            'items': items,
+            'item_code': self.item.code,
+            'name': self.item.name,
+            'unit': self.item.unit,
+            'summary': self.summary(),
+        }
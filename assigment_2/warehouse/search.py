@@ -0,0 +1,96 @@
+"""
+Full-text item search over the `warehouse_item_fts` FTS5 index
+(migrations 0003 and 0008).
+
+Every word of the query must match a word of the item name or description,
+the last one as a prefix so results follow the user while typing. Results
+are ranked by bm25 with the name weighted above the description; deleted
+items are filtered in the same query.
+
+bm25 has to score every match before the first page can be returned, which
+takes hundreds of milliseconds once a term matches a large part of a
+million-row table. Queries with more than `RANK_LIMIT` matches are
+therefore returned in index order instead, which reads only the requested
+page.
+
+The index is contentless and keyed by `warehouse_item_search_key.id`, an
+integer assigned once per item code. The implicit rowid of `warehouse_item`
+cannot be used: the primary key is the code, so SQLite renumbers the rowids
+when it copies the table, as migrations altering Item do. Such a copy also
+drops the triggers, see warehouse/search_index.py.
+"""
+import heapq
+import re
+
+from django.db import connections, router
+
+from core.sharding import shard_aliases
+from .models import Item
+
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+RANK_LIMIT = 10000
+
+COUNT_SQL = """
+    SELECT COUNT(*) FROM (
+        SELECT 1 FROM warehouse_item_fts WHERE warehouse_item_fts MATCH %s LIMIT %s
+    )
+"""
+
+RANKED_SQL = f"""
+    SELECT bm25(warehouse_item_fts, {NAME_WEIGHT}, {DESCRIPTION_WEIGHT}) AS score, item.code
+    FROM warehouse_item_fts
+    JOIN warehouse_item_search_key AS search_key ON search_key.id = warehouse_item_fts.rowid
+    JOIN warehouse_item AS item ON item.code = search_key.item_id
+    WHERE warehouse_item_fts MATCH %s AND item.is_deleted = 0
+    ORDER BY score, item.code
+    LIMIT %s OFFSET %s
+"""
+
+UNRANKED_SQL = """
+    SELECT 0, item.code
+    FROM warehouse_item_fts
+    JOIN warehouse_item_search_key AS search_key ON search_key.id = warehouse_item_fts.rowid
+    JOIN warehouse_item AS item ON item.code = search_key.item_id
+    WHERE warehouse_item_fts MATCH %s AND item.is_deleted = 0
+    ORDER BY warehouse_item_fts.rowid
+    LIMIT %s OFFSET %s
+"""
+
+
+def match_expression(text):
+    # Quoting every word keeps FTS5 operators and punctuation in user input
+    # from being parsed as query syntax. Only the last word is a prefix:
+    # prefix terms have to merge the doclists of every matching token.
+    words = [f'"{word}"' for word in re.findall(r'\w+', text)]
+    if words:
+        words[-1] += '*'
+    return ' '.join(words)
+
+
+def ranked_codes(using, match, limit, offset):
+    with connections[using].cursor() as cursor:
+        cursor.execute(COUNT_SQL, [match, RANK_LIMIT + 1])
+        sql = RANKED_SQL if cursor.fetchone()[0] <= RANK_LIMIT else UNRANKED_SQL
+        cursor.execute(sql, [match, limit, offset])
+        return [(score, code, using) for score, code in cursor.fetchall()]
+
+
+def search(text, limit, offset):
+    """
+    Return `(alias, code)` pairs of one page of results, best first, and
+    whether another page follows.
+    """
+    match = match_expression(text)
+    if not match:
+        return [], False
+
+    aliases = shard_aliases()
+    if aliases:
+        # Every shard returns its own best offset + limit hits; the page is
+        # cut from their merge.
+        rows = list(heapq.merge(*(ranked_codes(alias, match, offset + limit + 1, 0) for alias in aliases)))
+        rows = rows[offset:offset + limit + 1]
+    else:
+        rows = ranked_codes(router.db_for_read(Item), match, limit + 1, offset)
+    return [(alias, code) for _, code, alias in rows[:limit]], len(rows) > limit
@@ -0,0 +1,70 @@
+"""
+Upkeep of the item search index, see warehouse/search.py.
+
+SQLite rebuilds `warehouse_item` by copying it whenever a migration alters
+the Item table, and the copy loses the triggers that keep the index in
+sync. `install_index` runs after every migrate and restores them.
+Migration 0008 created them from its own copy of this SQL.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+
+from .models import Item
+
+TRIGGER_NAMES = ['warehouse_item_fts_insert', 'warehouse_item_fts_delete', 'warehouse_item_fts_update']
+
+# Stock updates rewrite the whole row, so the update trigger only reindexes
+# when the text actually changed.
+TRIGGER_SQL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS warehouse_item_fts_insert AFTER INSERT ON warehouse_item BEGIN
+        INSERT OR IGNORE INTO warehouse_item_search_key (item_id) VALUES (new.code);
+        INSERT INTO warehouse_item_fts (rowid, name, description)
+        SELECT id, new.name, new.description FROM warehouse_item_search_key WHERE item_id = new.code;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS warehouse_item_fts_delete AFTER DELETE ON warehouse_item BEGIN
+        INSERT INTO warehouse_item_fts (warehouse_item_fts, rowid, name, description)
+        SELECT 'delete', id, old.name, old.description FROM warehouse_item_search_key WHERE item_id = old.code;
+        DELETE FROM warehouse_item_search_key WHERE item_id = old.code;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS warehouse_item_fts_update AFTER UPDATE OF name, description ON warehouse_item
+    WHEN old.name IS NOT new.name OR old.description IS NOT new.description BEGIN
+        INSERT INTO warehouse_item_fts (warehouse_item_fts, rowid, name, description)
+        SELECT 'delete', id, old.name, old.description FROM warehouse_item_search_key WHERE item_id = old.code;
+        INSERT INTO warehouse_item_fts (rowid, name, description)
+        SELECT id, new.name, new.description FROM warehouse_item_search_key WHERE item_id = new.code;
+    END
+    """,
+]
+
+REBUILD_SQL = [
+    'DELETE FROM warehouse_item_search_key WHERE item_id NOT IN (SELECT code FROM warehouse_item)',
+    'INSERT OR IGNORE INTO warehouse_item_search_key (item_id) SELECT code FROM warehouse_item',
+    "INSERT INTO warehouse_item_fts (warehouse_item_fts) VALUES ('delete-all')",
+    """
+    INSERT INTO warehouse_item_fts (rowid, name, description)
+    SELECT search_key.id, item.name, item.description
+    FROM warehouse_item_search_key AS search_key
+    JOIN warehouse_item AS item ON item.code = search_key.item_id
+    """,
+]
+
+
+def install_index(sender=None, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    `post_migrate` handler: recreate the index triggers a migration dropped
+    with a copy of `warehouse_item`, and rebuild the index from the table.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or not router.allow_migrate_model(using, Item):
+        return
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        names = {name for name, in cursor.fetchall()}
+        if 'warehouse_item_search_key' not in names or names.issuperset(TRIGGER_NAMES):
+            return
+        for sql in TRIGGER_SQL + REBUILD_SQL:
+            cursor.execute(sql)
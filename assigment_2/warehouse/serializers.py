@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Item, PurchaseHeader, PurchaseDetail, SellHeader, SellDetail
+from .models import Item, PurchaseHeader, PurchaseDetail, SellHeader, SellDetail, ChangeLog
 
 class ItemSerializer(serializers.ModelSerializer):
     class Meta:
@@ -30,4 +30,29 @@ class SellHeaderSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = SellHeader
-        fields = ['code', 'date', 'description', 'details']
\ No newline at end of file
+        fields = ['code', 'date', 'description', 'details']
+
+class ChangeLogSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ChangeLog
+        fields = ['id', 'item', 'kind', 'reference', 'quantity', 'cost', 'stock', 'balance', 'created_at']
+
+class MovementTotalsSerializer(serializers.Serializer):
+    purchased_qty = serializers.DecimalField(max_digits=None, decimal_places=2)
+    purchased_cost = serializers.DecimalField(max_digits=None, decimal_places=2)
+    sold_qty = serializers.DecimalField(max_digits=None, decimal_places=2)
+    sold_cost = serializers.DecimalField(max_digits=None, decimal_places=2)
+    lines = serializers.IntegerField()
+
+class ItemMovementSerializer(MovementTotalsSerializer):
+    item = serializers.CharField()
+    opening_value = serializers.DecimalField(max_digits=None, decimal_places=2)
+    closing_value = serializers.DecimalField(max_digits=None, decimal_places=2)
+    turnover = serializers.DecimalField(max_digits=None, decimal_places=2, allow_null=True)
+
+class MonthlyMovementSerializer(MovementTotalsSerializer):
+    month = serializers.DateField(format='%Y-%m')
+
+class TopMoverSerializer(MonthlyMovementSerializer):
+    rank = serializers.IntegerField()
+    item = serializers.CharField()
\ No newline at end of file
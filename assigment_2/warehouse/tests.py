@@ -1,3 +1,1161 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import pstats
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from contextlib import ExitStack
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from types import SimpleNamespace
 
-# Create your tests here.
+from unittest import skipUnless
+from unittest.mock import patch
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.db.backends.sqlite3.base import SQLiteCursorWrapper
+from django.db.models import CharField, F, Sum
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import URLResolver, reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from core.sharding import ID_BLOCK, ShardRouter, merge_sorted, shard_for, use_shard
+from core.replicas import PIN_COOKIE, ReadYourWritesMiddleware, ReplicaRouter, pin_to_primary, sync_replica
+from . import changes, urls
+from .exports import EXPORT_ERROR, csv_stream, xlsx_stream, zip_stream
+from .generator import DatasetGenerator
+from .importer import TransactionImporter
+from .metrics import REGISTRY
+from .models import ChangeLog, ImportCheckpoint, Item, PurchaseHeader, PurchaseDetail, SellHeader, SellDetail, StockMovement
+from .renderers import FastJSONRenderer
+from .reports import ENTRY_FIELDS
+from .search import search
+
+try:
+    import openpyxl
+except ImportError:  # Only reads the XLSX exports back.
+    openpyxl = None
+
+
+# The tests below cover the single database layout, also when run with the
+# sharded settings; ShardedApiTests covers the sharded one.
+single_database = override_settings(WAREHOUSE_SHARDS=[])
+
+
+@single_database
+class WarehouseTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.items = [
+            Item.objects.create(code='ITEM001', name='Product 1', unit='pcs', description='First'),
+            Item.objects.create(code='ITEM002', name='Produk \u00e9 \u2028 2', unit='box', description=None),
+        ]
+        purchase = PurchaseHeader.objects.create(code='PO001', date=date(2025, 1, 1), description='Purchase')
+        PurchaseDetail.objects.create(header=purchase, item=cls.items[0], quantity=Decimal('10'), unit_price=Decimal('1.5'))
+        PurchaseDetail.objects.create(header=purchase, item=cls.items[1], quantity=Decimal('3'), unit_price=Decimal('7'))
+        PurchaseHeader.objects.create(code='PO002', date=date(2025, 1, 2))
+
+        sell = SellHeader.objects.create(code='SO001', date=date(2025, 1, 3), description='Sell')
+        SellDetail.objects.create(header=sell, item=Item.objects.get(code='ITEM001'), quantity=Decimal('4'))
+
+    def setUp(self):
+        self.client = APIClient()
+
+
+class FastReadTests(WarehouseTestCase):
+    urls = [
+        '/api/items/',
+        '/api/purchase/',
+        '/api/sell/',
+        '/api/purchase/PO001/details/',
+        '/api/sell/SO001/details/',
+    ]
+
+    def test_fast_read_matches_serializer_output(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                with override_settings(WAREHOUSE_FAST_READ=False):
+                    expected = self.client.get(url, HTTP_ACCEPT='application/json')
+                fast = self.client.get(url, HTTP_ACCEPT='application/json')
+                self.assertEqual(fast.status_code, 200)
+                self.assertEqual(fast.content, expected.content)
+
+    def test_fast_renderer_matches_json_renderer(self):
+        data = {
+            'code': 'ITEM\u2029',
+            'date': date(2025, 1, 1),
+            'amount': Decimal('1.50'),
+            'nested': [{'a': None, 'b': True, 'c': 1.25}],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+class ConditionalGetTests(WarehouseTestCase):
+    def revalidate(self, url, response, **extra):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'], **extra)
+
+    def test_unchanged_resources_return_304_with_one_query(self):
+        for url in ('/api/items/', '/api/items/ITEM001/',
+                    '/api/report/ITEM001/?start_date=2025-01-01&end_date=2025-01-31'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response['ETag'].startswith('"'))
+                self.assertNotIn('Last-Modified', response)
+                with self.assertNumQueries(1):
+                    cached = self.revalidate(url, response)
+                self.assertEqual(cached.status_code, 304)
+                self.assertEqual(cached['ETag'], response['ETag'])
+                self.assertEqual(cached.content, b'')
+
+    def test_stock_movement_changes_item_and_report_tags(self):
+        urls = ['/api/items/', '/api/items/ITEM001/', '/api/report/ITEM001/?start_date=2025-01-01&end_date=2025-01-31']
+        before = {url: self.client.get(url) for url in urls}
+        self.client.post('/api/sell/SO001/add_detail/', {'item': 'ITEM001', 'quantity': '1'}, format='json')
+        for url in urls:
+            self.assertEqual(self.revalidate(url, before[url]).status_code, 200, url)
+
+    def test_if_modified_since_is_ignored(self):
+        # A date in the future would have matched any write of the same second.
+        url = '/api/items/ITEM001/'
+        self.client.patch(url, {'name': 'Renamed'}, format='json')
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'Renamed')
+
+    def test_header_edit_changes_report_tag(self):
+        url = '/api/report/ITEM001/?start_date=2025-01-01&end_date=2025-01-31'
+        before = self.client.get(url)
+        self.client.patch('/api/purchase/PO001/', {'description': 'Restock'}, format='json')
+        response = self.revalidate(url, before)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['result']['items'][0]['description'], 'Restock')
+
+    def test_representations_have_their_own_tags(self):
+        json_response = self.client.get('/api/items/')
+        csv_response = self.client.get('/api/items/?format=csv')
+        self.assertNotEqual(json_response['ETag'], csv_response['ETag'])
+        self.assertEqual(self.revalidate('/api/items/?format=csv', json_response).status_code, 200)
+        self.assertEqual(self.client.get('/api/items/NOPE/', HTTP_IF_NONE_MATCH='*').status_code, 404)
+
+
+class SearchTests(WarehouseTestCase):
+    def search(self, **params):
+        response = self.client.get('/api/items/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def codes(self, **params):
+        return [item['code'] for item in self.search(**params)['results']]
+
+    def test_prefix_match_on_name_and_description(self):
+        self.assertEqual(self.codes(q='prod'), ['ITEM001', 'ITEM002'])
+        self.assertEqual(self.codes(q='fir'), ['ITEM001'])
+        self.assertEqual(self.codes(q='product 1'), ['ITEM001'])
+        self.assertEqual(self.codes(q='"* OR NOT'), [])
+        self.assertEqual(self.codes(q=''), [])
+
+    def test_name_matches_rank_first(self):
+        Item.objects.create(code='ITEM003', name='Widget', unit='pcs', description='spare gear')
+        Item.objects.create(code='ITEM004', name='Gear box', unit='pcs')
+        self.assertEqual(self.codes(q='gear'), ['ITEM004', 'ITEM003'])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.client.patch('/api/items/ITEM001/', {'name': 'Bolt'}, format='json')
+        self.assertEqual(self.codes(q='bolt'), ['ITEM001'])
+        self.assertEqual(self.codes(q='product'), [])
+        self.client.delete('/api/items/ITEM001/')
+        self.assertEqual(self.codes(q='bolt'), [])
+
+    @patch('warehouse.search.RANK_LIMIT', 1)
+    def test_broad_queries_skip_ranking(self):
+        Item.objects.create(code='ITEM000', name='Widget', unit='pcs', description='gear')
+        Item.objects.create(code='ITEM003', name='Gear', unit='pcs')
+        self.assertEqual(self.codes(q='gear'), ['ITEM000', 'ITEM003'])
+
+    def test_pagination(self):
+        page = self.search(q='prod', limit=1)
+        self.assertEqual([item['code'] for item in page['results']], ['ITEM001'])
+        self.assertIsNone(page['previous'])
+        page = self.client.get(page['next']).json()
+        self.assertEqual([item['code'] for item in page['results']], ['ITEM002'])
+        self.assertIsNone(page['next'])
+        self.assertEqual(page['results'][0], self.client.get('/api/items/ITEM002/').json())
+
+
+@single_database
+class SearchIndexTests(TransactionTestCase):
+    def codes(self, text):
+        return [code for _, code in search(text, 10, 0)[0]]
+
+    def test_index_survives_table_copy_and_vacuum(self):
+        for code, name in [('ITEM001', 'Bolt'), ('ITEM002', 'Gear'), ('ITEM003', 'Gear box')]:
+            Item.objects.create(code=code, name=name, unit='pcs')
+        Item.objects.filter(code='ITEM001').delete()
+
+        # Altering a column makes SQLite copy the table, renumbering its
+        # rowids and dropping its triggers; migrate puts the triggers back.
+        old_field = Item._meta.get_field('name')
+        new_field = CharField(max_length=300)
+        new_field.set_attributes_from_name('name')
+        with connection.schema_editor() as editor:
+            editor.alter_field(Item, old_field, new_field)
+        try:
+            call_command('migrate', verbosity=0)
+            with connection.cursor() as cursor:
+                cursor.execute('VACUUM')
+            Item.objects.filter(code='ITEM002').update(name='Sprocket')
+            Item.objects.create(code='ITEM004', name='Gear wheel', unit='pcs')
+
+            self.assertEqual(self.codes('gear'), ['ITEM003', 'ITEM004'])
+            self.assertEqual(self.codes('sprocket'), ['ITEM002'])
+            self.assertEqual(self.codes('bolt'), [])
+            with connection.cursor() as cursor:
+                cursor.execute("INSERT INTO warehouse_item_fts (warehouse_item_fts, rank) VALUES ('integrity-check', 1)")
+        finally:
+            with connection.schema_editor() as editor:
+                editor.alter_field(Item, new_field, old_field)
+            call_command('migrate', verbosity=0)
+
+
+class LedgerTests(WarehouseTestCase):
+    def position(self, as_of, code='ITEM001'):
+        data = self.client.get(f'/api/items/{code}/', {'as_of': as_of}).json()
+        return data['stock'], data['balance']
+
+    def test_item_detail_as_of(self):
+        self.assertEqual(self.position('2024-12-31'), ('0.00', '0.00'))
+        self.assertEqual(self.position('2025-01-02'), ('10.00', '15.00'))
+        self.assertEqual(self.position('2025-01-03'), ('6.00', '9.00'))
+        self.assertEqual(self.position('2030-01-01'), ('6.00', '9.00'))
+        self.assertNotIn('as_of', self.client.get('/api/items/ITEM001/').json())
+        self.assertEqual(self.client.get('/api/items/ITEM001/', {'as_of': '03-01-2025'}).status_code, 400)
+
+    def test_valuation_is_one_index_lookup(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/items/ITEM001/valuation/', {'as_of': '2025-01-02'})
+        self.assertEqual(response.json(), {
+            'item_code': 'ITEM001', 'as_of': '2025-01-02',
+            'stock': '10.00', 'balance': '15.00', 'unit_cost': '1.50',
+        })
+
+    def test_backdated_purchase_recosts_later_sales(self):
+        self.client.post('/api/purchase/', {'code': 'PO000', 'date': '2024-12-30'}, format='json')
+        response = self.client.post('/api/purchase/PO000/add_detail/',
+                                    {'item': 'ITEM001', 'quantity': '2', 'unit_price': '3'}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        # SO001 now sells PO000 first: 2 at 3 and 2 at 1.5.
+        self.assertEqual(self.position('2024-12-30'), ('2.00', '6.00'))
+        self.assertEqual(self.position('2025-01-03'), ('8.00', '12.00'))
+        item = self.client.get('/api/items/ITEM001/').json()
+        self.assertEqual((item['stock'], item['balance']), self.position(date.today().isoformat()))
+        self.assertEqual(
+            sorted(PurchaseDetail.objects.filter(item='ITEM001').values_list('header', 'remaining_quantity')),
+            [('PO000', Decimal('0')), ('PO001', Decimal('8'))],
+        )
+        self.assertEqual(ChangeLog.objects.filter(item='ITEM001').last().balance, Decimal('12'))
+        call_command('check_ledger', stdout=StringIO())
+
+    def test_recost_rewrites_the_ledger_from_the_backdated_date(self):
+        self.client.post('/api/sell/', {'code': 'SO002', 'date': '2025-01-05'}, format='json')
+        self.client.post('/api/sell/SO002/add_detail/', {'item': 'ITEM001', 'quantity': '5'}, format='json')
+        kept = list(StockMovement.objects.filter(item='ITEM001', date__lt=date(2025, 1, 4)).values_list('id', flat=True))
+
+        self.client.post('/api/purchase/', {'code': 'PO003', 'date': '2025-01-04'}, format='json')
+        response = self.client.post('/api/purchase/PO003/add_detail/',
+                                    {'item': 'ITEM001', 'quantity': '2', 'unit_price': '3'}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        # SO002 still sells from what PO001 had left after SO001.
+        self.assertEqual(self.position('2025-01-04'), ('8.00', '15.00'))
+        self.assertEqual(self.position('2025-01-05'), ('3.00', '7.50'))
+        self.assertEqual(list(StockMovement.objects.filter(item='ITEM001', date__lt=date(2025, 1, 4))
+                              .values_list('id', flat=True)), kept)
+        lots = PurchaseDetail.objects.filter(item='ITEM001').order_by('header__date')
+        self.assertEqual(list(lots.values_list('remaining_quantity', flat=True)), [Decimal('1'), Decimal('2')])
+        call_command('check_ledger', stdout=StringIO())
+
+    def test_backdated_sale_cannot_oversell_its_date(self):
+        self.client.post('/api/sell/', {'code': 'SO000', 'date': '2024-12-31'}, format='json')
+        response = self.client.post('/api/sell/SO000/add_detail/', {'item': 'ITEM001', 'quantity': '1'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(SellDetail.objects.filter(header='SO000').exists())
+        self.assertEqual(self.position('2030-01-01'), ('6.00', '9.00'))
+
+        response = self.client.patch('/api/purchase/PO001/', {'date': '2025-01-04'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(PurchaseHeader.objects.get(code='PO001').date, date(2025, 1, 1))
+        call_command('check_ledger', stdout=StringIO())
+
+    def test_failed_sale_leaves_the_lots_alone(self):
+        PurchaseDetail.objects.create(header=PurchaseHeader.objects.get(code='PO002'), item=self.items[0],
+                                      quantity=Decimal('1'), unit_price=Decimal('2'))
+        header = SellHeader.objects.create(code='SO002', date=date(2025, 1, 4))
+        with self.assertRaises(ValidationError):
+            SellDetail(header=header, item=Item.objects.get(code='ITEM001'), quantity=Decimal('8')).save()
+        lots = PurchaseDetail.objects.filter(item='ITEM001').values_list('remaining_quantity', flat=True)
+        self.assertEqual(sorted(lots), [Decimal('1'), Decimal('6')])
+        self.assertEqual(self.position('2030-01-01'), ('7.00', '11.00'))
+
+    def test_header_date_change_moves_movements(self):
+        call_command('check_ledger', stdout=StringIO())
+        self.client.patch('/api/sell/SO001/', {'date': '2025-01-10'}, format='json')
+        self.assertEqual(self.position('2025-01-09'), ('10.00', '15.00'))
+        self.assertEqual(self.position('2025-01-10'), ('6.00', '9.00'))
+        call_command('check_ledger', stdout=StringIO())
+
+    def test_rebuild_restores_missing_ledger(self):
+        StockMovement.objects.all().delete()
+        out = StringIO()
+        call_command('check_ledger', rebuild=True, stdout=out)
+        self.assertIn('ITEM001: 2025-01-01: ledger no movement, replay 10.00 worth 15.00; rebuilt 2 movements',
+                      out.getvalue())
+        self.assertEqual(self.position('2025-01-03'), ('6.00', '9.00'))
+        call_command('check_ledger', stdout=StringIO())
+
+    def test_rebuild_refuses_a_replay_that_disagrees_with_the_item(self):
+        StockMovement.objects.filter(item='ITEM001').delete()
+        Item.objects.filter(code='ITEM001').update(balance=Decimal('10'))
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('check_ledger', rebuild=True, stdout=out)
+        self.assertIn('not rebuilt, replay ends at 6.00 worth 9.00, item has 6.00 worth 10.00', out.getvalue())
+        self.assertFalse(StockMovement.objects.filter(item='ITEM001').exists())
+
+
+class AnalyticsTests(WarehouseTestCase):
+    def get(self, path, **params):
+        response = self.client.get(f'/api/analytics/{path}/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_item_totals_and_turnover(self):
+        with self.assertNumQueries(2):
+            data = self.get('items')
+        self.assertEqual(data['results'][0], {
+            'purchased_qty': '10.00', 'purchased_cost': '15.00', 'sold_qty': '4.00', 'sold_cost': '6.00',
+            'lines': 2, 'item': 'ITEM001', 'opening_value': '0.00', 'closing_value': '9.00', 'turnover': '1.33',
+        })
+        self.assertEqual([row['item'] for row in data['results']], ['ITEM001', 'ITEM002'])
+
+        rows = self.get('items', start_date='2025-01-02')['results']
+        self.assertEqual([(row['item'], row['opening_value'], row['turnover']) for row in rows],
+                         [('ITEM001', '15.00', '0.50')])
+
+        page = self.get('items', ordering='-purchased_cost', limit=1)
+        self.assertEqual([row['item'] for row in page['results']], ['ITEM002'])
+        self.assertIn('offset=1', page['next'])
+        self.assertEqual(self.client.get('/api/analytics/items/', {'ordering': 'name'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/analytics/items/', {'end_date': '31-01-2025'}).status_code, 400)
+
+    def test_backdated_purchase_matches_the_stock_card(self):
+        self.client.post('/api/purchase/', {'code': 'PO000', 'date': '2024-12-30'}, format='json')
+        self.client.post('/api/purchase/PO000/add_detail/',
+                         {'item': 'ITEM001', 'quantity': '2', 'unit_price': '3'}, format='json')
+
+        row = self.get('items', items='ITEM001')['results'][0]
+        card = self.client.get('/api/report/ITEM001/', {'start_date': '2024-12-01', 'end_date': '2025-01-31'},
+                               HTTP_ACCEPT='application/json').json()['result']
+        sold = [entry for entry in card['items'] if entry['out_qty']]
+        self.assertEqual(Decimal(row['sold_cost']), sum(entry['out_total'] for entry in sold))
+        self.assertEqual(Decimal(row['closing_value']), card['summary']['balance'])
+        self.assertEqual((row['sold_cost'], row['closing_value']), ('9.00', '12.00'))
+
+    def test_monthly_totals_and_top_items(self):
+        self.client.post('/api/purchase/', {'code': 'PO003', 'date': '2025-02-10'}, format='json')
+        for code, quantity in (('ITEM001', '1'), ('ITEM002', '2')):
+            self.client.post('/api/purchase/PO003/add_detail/',
+                             {'item': code, 'quantity': quantity, 'unit_price': '5'}, format='json')
+
+        months = self.get('monthly')['results']
+        self.assertEqual([(row['month'], row['purchased_cost'], row['sold_cost'], row['lines']) for row in months],
+                         [('2025-01', '36.00', '6.00', 3), ('2025-02', '15.00', '0.00', 2)])
+        self.assertEqual(len(self.get('monthly', items='ITEM001', start_date='2025-02-01')['results']), 1)
+
+        top = self.get('top', by='purchased_qty', top=1)['results']
+        self.assertEqual([(row['month'], row['rank'], row['item']) for row in top],
+                         [('2025-01', 1, 'ITEM001'), ('2025-02', 1, 'ITEM002')])
+        self.assertEqual(len(self.get('top', top=2, limit=3)['results']), 3)
+
+
+class ChangeFeedTests(WarehouseTestCase):
+    def test_catch_up_in_batches(self):
+        first = self.client.get('/api/changes/', {'limit': 2}).json()
+        self.assertEqual([(c['item'], c['kind'], c['stock'], c['balance']) for c in first['changes']],
+                         [('ITEM001', 'purchase', '10.00', '15.00'), ('ITEM002', 'purchase', '3.00', '21.00')])
+        self.assertTrue(first['more'])
+        self.assertEqual(first['cursor'], str(first['changes'][-1]['id']))
+
+        rest = self.client.get('/api/changes/', {'after': first['cursor']}).json()
+        self.assertEqual([(c['reference'], c['quantity'], c['cost'], c['stock']) for c in rest['changes']],
+                         [('SO001', '-4.00', '-6.00', '6.00')])
+        self.assertFalse(rest['more'])
+
+        empty = self.client.get('/api/changes/', {'after': rest['cursor']}).json()
+        self.assertEqual(empty, {'changes': [], 'cursor': rest['cursor'], 'more': False})
+        self.assertEqual(self.client.get('/api/changes/', {'after': 'x'}).status_code, 400)
+
+    def test_movement_commit_wakes_waiters(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post('/api/purchase/PO002/add_detail/',
+                             {'item': 'ITEM002', 'quantity': '1', 'unit_price': '7'}, format='json')
+        self.assertIn(changes.notify, callbacks)
+        self.assertEqual(ChangeLog.objects.latest('id').stock, Decimal('4'))
+
+        woken = threading.Event()
+        waiter = threading.Thread(target=lambda: (changes.broker.wait(10), woken.set()))
+        waiter.start()
+        time.sleep(0.05)
+        callbacks[-1]()
+        waiter.join(1)
+        self.assertTrue(woken.is_set())
+
+    def test_long_poll_times_out_with_same_cursor(self):
+        cursor = str(ChangeLog.objects.latest('id').id)
+        started = time.monotonic()
+        with patch.object(changes, 'POLL_SECONDS', 0.1):
+            response = self.client.get('/api/changes/', {'after': cursor, 'wait': 1})
+        self.assertGreaterEqual(time.monotonic() - started, 1)
+        self.assertEqual(response.json(), {'changes': [], 'cursor': cursor, 'more': False})
+
+    def test_long_poll_is_capped_under_wsgi(self):
+        cursor = str(ChangeLog.objects.latest('id').id)
+        started = time.monotonic()
+        with patch.object(changes, 'POLL_SECONDS', 0.1), patch.object(changes, 'WSGI_MAX_WAIT_SECONDS', 1):
+            self.client.get('/api/changes/', {'after': cursor, 'wait': 30})
+        self.assertLess(time.monotonic() - started, 5)
+
+    async def test_stream_resumes_from_last_event_id(self):
+        ids = await sync_to_async(list)(ChangeLog.objects.order_by('id').values_list('id', flat=True))
+        # The test transaction is only visible to the connection of this thread.
+        with patch.object(changes, 'STREAM_SECONDS', 0.2), patch.object(changes, 'POLL_SECONDS', 0.05), \
+                patch.object(changes, 'read_async', sync_to_async(changes.read)):
+            response = await self.async_client.get('/api/changes/stream/', headers={'Last-Event-ID': str(ids[0])})
+            body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = [event for event in body.split('\n\n') if event.startswith('id:')]
+        self.assertEqual([event.splitlines()[0] for event in events], [f'id: {ids[1]}', f'id: {ids[2]}'])
+        self.assertEqual(json.loads(events[-1].splitlines()[2][len('data: '):])['reference'], 'SO001')
+
+    def test_stream_needs_asgi(self):
+        self.assertEqual(self.client.get('/api/changes/stream/').status_code, 501)
+
+
+@single_database
+class GenerateDataTests(TestCase):
+    def test_generated_dataset_is_fifo_consistent(self):
+        call_command('generate_data', items=5, orders=40, lines=2, seed=1, batch_size=7, stdout=StringIO())
+
+        self.assertEqual(Item.objects.count(), 5)
+        self.assertEqual(PurchaseHeader.objects.count() + SellHeader.objects.count(), 40)
+        for item in Item.objects.all():
+            lots = PurchaseDetail.objects.filter(item=item)
+            bought = lots.aggregate(total=Sum('quantity'))['total'] or 0
+            sold = SellDetail.objects.filter(item=item).aggregate(total=Sum('quantity'))['total'] or 0
+            self.assertEqual(item.stock, bought - sold)
+            self.assertEqual(item.stock, sum(lot.remaining_quantity for lot in lots))
+            self.assertEqual(item.balance, sum(lot.remaining_quantity * lot.unit_price for lot in lots))
+        call_command('check_ledger', stdout=StringIO())
+
+    def test_batch_commands_refuse_shards(self):
+        for command, *args in (('generate_data',), ('import_transactions', __file__)):
+            with self.subTest(command=command), override_settings(WAREHOUSE_SHARDS=['shard1', 'shard2']):
+                with self.assertRaisesMessage(CommandError, 'does not support WAREHOUSE_SHARDS'):
+                    call_command(command, *args, stdout=StringIO())
+        self.assertFalse(Item.objects.exists())
+
+
+class MetricsTests(WarehouseTestCase):
+    def setUp(self):
+        super().setUp()
+        REGISTRY.clear()
+
+    def test_metrics_endpoint_reports_view_histograms(self):
+        self.client.get('/api/items/')
+        self.client.get('/api/items/')
+
+        response = self.client.get('/metrics/')
+        body = response.content.decode()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE warehouse_request_duration_seconds histogram', body)
+        self.assertIn('warehouse_requests_total{view="item-list",method="GET",status="200"} 2', body)
+        self.assertIn('warehouse_request_duration_seconds_count{view="item-list",method="GET"} 2', body)
+        # One query for the ETag validator, one for the rows.
+        self.assertIn('warehouse_db_queries_bucket{view="item-list",method="GET",le="1"} 0', body)
+        self.assertIn('warehouse_db_queries_bucket{view="item-list",method="GET",le="2"} 2', body)
+
+    def test_profile_header_dumps_stats(self):
+        with tempfile.TemporaryDirectory() as profile_dir:
+            with override_settings(WAREHOUSE_PROFILE_DIR=profile_dir):
+                plain = self.client.get('/api/items/')
+                profiled = self.client.get('/api/items/', HTTP_X_PROFILE='1')
+
+            self.assertNotIn('X-Profile-File', plain)
+            path = Path(profile_dir) / profiled['X-Profile-File']
+            self.assertTrue(pstats.Stats(str(path)).total_calls > 0)
+
+    def test_metrics_and_profiling_are_internal_only(self):
+        self.assertEqual(self.client.get('/metrics/', REMOTE_ADDR='203.0.113.5').status_code, 404)
+        with tempfile.TemporaryDirectory() as profile_dir:
+            with override_settings(WAREHOUSE_PROFILE_DIR=profile_dir):
+                response = self.client.get('/api/items/', HTTP_X_PROFILE='1', REMOTE_ADDR='203.0.113.5')
+        self.assertNotIn('X-Profile-File', response)
+
+    def test_streaming_queries_are_counted_when_the_body_is_sent(self):
+        response = self.client.get('/api/items/', {'format': 'csv'})
+        self.assertNotIn('warehouse_requests_total{view="item-list"', self.client.get('/metrics/').content.decode())
+        b''.join(response.streaming_content)
+        response.close()
+
+        body = self.client.get('/metrics/').content.decode()
+        # The ETag validator, then the rows read while the CSV is streamed.
+        self.assertIn('warehouse_db_queries_bucket{view="item-list",method="GET",le="1"} 0', body)
+        self.assertIn('warehouse_db_queries_bucket{view="item-list",method="GET",le="2"} 1', body)
+
+
+ITEM = 'ITEM0000001'
+ITEM_BODY = {'code': 'NEW001', 'name': 'New', 'unit': 'pcs'}
+HEADER_BODY = {'code': 'NEW001', 'date': '2025-07-01', 'description': 'New'}
+PERIOD = {'start_date': '2024-03-01', 'end_date': '2024-05-31'}
+
+# Upper bounds per request on the QueryBudgetTests fixture: 40 items and 200
+# generated orders of up to 3 lines, plus PO-BUDGET and SO-BUDGET with 3 lines
+# each. Rows are the rows returned by all SELECTs of the request; list
+# endpoints grow with the fixture, query counts must not.
+QUERY_BUDGETS = [
+    # method, route, path kwargs, query or body, status, queries, rows
+    ('GET', 'api-root', {}, {}, 200, 0, 0),
+    ('GET', 'item-list', {}, {}, 200, 2, 41),
+    ('GET', 'item-list', {}, {'format': 'csv'}, 200, 2, 41),
+    ('POST', 'item-list', {}, ITEM_BODY, 201, 2, 0),
+    ('GET', 'item-detail', {'code': ITEM}, {}, 200, 2, 2),
+    ('GET', 'item-detail', {'code': ITEM}, {'as_of': '2024-06-30'}, 200, 3, 3),
+    ('PUT', 'item-detail', {'code': ITEM}, dict(ITEM_BODY, code=ITEM), 200, 3, 1),
+    ('PATCH', 'item-detail', {'code': ITEM}, {'name': 'Renamed'}, 200, 2, 1),
+    ('DELETE', 'item-detail', {'code': ITEM}, {}, 204, 2, 1),
+    ('GET', 'item-search', {}, {'q': 'product'}, 200, 3, 42),
+    ('GET', 'item-valuation', {'code': ITEM}, {}, 200, 2, 2),
+    ('GET', 'purchaseheader-list', {}, {}, 200, 2, 408),
+    ('POST', 'purchaseheader-list', {}, HEADER_BODY, 201, 3, 0),
+    ('GET', 'purchaseheader-detail', {'code': 'PO-BUDGET'}, {}, 200, 2, 4),
+    # A new date re-costs every item on the header from the earlier of the two
+    # dates: its position and open lots then, and the lines since.
+    ('PUT', 'purchaseheader-detail', {'code': 'PO-BUDGET'}, dict(HEADER_BODY, code='PO-BUDGET', date='2025-05-01'),
+     200, 27, 43),
+    ('PATCH', 'purchaseheader-detail', {'code': 'PO-BUDGET'}, {'description': 'Changed'}, 200, 4, 4),
+    ('DELETE', 'purchaseheader-detail', {'code': 'PO-BUDGET'}, {}, 204, 2, 1),
+    ('POST', 'purchaseheader-add-detail', {'code': 'PO-BUDGET'},
+     {'item': ITEM, 'quantity': '2', 'unit_price': '3'}, 201, 8, 3),
+    ('GET', 'purchaseheader-details', {'code': 'PO-BUDGET'}, {}, 200, 2, 4),
+    ('GET', 'sellheader-list', {}, {}, 200, 2, 346),
+    ('POST', 'sellheader-list', {}, HEADER_BODY, 201, 3, 0),
+    ('GET', 'sellheader-detail', {'code': 'SO-BUDGET'}, {}, 200, 2, 4),
+    ('PUT', 'sellheader-detail', {'code': 'SO-BUDGET'}, dict(HEADER_BODY, code='SO-BUDGET'), 200, 27, 43),
+    ('PATCH', 'sellheader-detail', {'code': 'SO-BUDGET'}, {'description': 'Changed'}, 200, 4, 4),
+    ('DELETE', 'sellheader-detail', {'code': 'SO-BUDGET'}, {}, 204, 2, 1),
+    ('POST', 'sellheader-add-detail', {'code': 'SO-BUDGET'}, {'item': ITEM, 'quantity': '1'}, 201, 10, 9),
+    ('GET', 'sellheader-details', {'code': 'SO-BUDGET'}, {}, 200, 2, 4),
+    ('GET', 'report-list', {}, dict(PERIOD, format='csv', items=ITEM), 200, 3, 4),
+    ('GET', 'report-detail', {'code': ITEM}, PERIOD, 200, 4, 5),
+    ('GET', 'analytics-items', {}, PERIOD, 200, 2, 66),
+    ('GET', 'analytics-monthly', {}, PERIOD, 200, 1, 3),
+    ('GET', 'analytics-top', {}, PERIOD, 200, 1, 30),
+    ('GET', 'changes-list', {}, {'limit': 100}, 200, 1, 101),
+    ('GET', 'change-stream', {}, {}, 501, 0, 0),
+]
+
+
+def warehouse_routes():
+    """Map every named route in warehouse/urls.py to its HTTP methods."""
+    routes = {}
+
+    def walk(patterns):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                walk(pattern.url_patterns)
+            elif pattern.name:
+                # DRF adds 'head' to the actions of a viewset route on its first request.
+                actions = getattr(pattern.callback, 'actions', None) or {'get': None}
+                routes.setdefault(pattern.name, set()).update(method.upper() for method in actions if method != 'head')
+
+    walk(urls.urlpatterns)
+    return routes
+
+
+class QueryLog:
+    """`execute_wrapper` recording each query with the number of rows it returns."""
+    CONTROL = re.compile(r'\s*(SAVEPOINT|RELEASE|ROLLBACK|BEGIN|COMMIT)\b', re.IGNORECASE)
+    SELECT = re.compile(r'\s*(SELECT|WITH)\b', re.IGNORECASE)
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.CONTROL.match(sql):
+            return execute(sql, params, many, context)
+        rows = 0
+        if not many and self.SELECT.match(sql):
+            # Counted on a separate cursor, before the query itself runs.
+            cursor = self.connection.connection.cursor(factory=SQLiteCursorWrapper)
+            try:
+                rows = cursor.execute(f'SELECT COUNT(*) FROM ({sql})', params).fetchone()[0]
+            finally:
+                cursor.close()
+        self.queries.append((rows, sql, params))
+        return execute(sql, params, many, context)
+
+    @property
+    def rows(self):
+        return sum(rows for rows, _, _ in self.queries)
+
+    def report(self):
+        alias = self.connection.alias
+        return '\n'.join(f'  [{alias}, {rows} rows] {sql} {list(params or ())}' for rows, sql, params in self.queries)
+
+
+@single_database
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        DatasetGenerator(items=40, orders=200, lines=3, seed=3).run()
+        purchase = PurchaseHeader.objects.create(code='PO-BUDGET', date=date(2025, 6, 1))
+        sell = SellHeader.objects.create(code='SO-BUDGET', date=date(2025, 6, 2))
+        # ITEM has no line on these headers, so its new lines come after every
+        # movement and the budgets cover the usual, not the back-dated, path.
+        for code in ('ITEM0000002', 'ITEM0000003', 'ITEM0000004'):
+            PurchaseDetail.objects.create(header=purchase, item=Item.objects.get(code=code),
+                                          quantity=Decimal('50'), unit_price=Decimal('4'))
+            SellDetail.objects.create(header=sell, item=Item.objects.get(code=code), quantity=Decimal('5'))
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_every_route_has_a_budget(self):
+        budgeted = {(method, name) for method, name, *_ in QUERY_BUDGETS}
+        missing = sorted((method, name) for name, methods in warehouse_routes().items()
+                         for method in methods if (method, name) not in budgeted)
+        self.assertEqual(missing, [], 'Add a row to QUERY_BUDGETS for every new route and method.')
+
+    def test_routes_stay_within_budget(self):
+        for method, name, kwargs, data, expected_status, max_queries, max_rows in QUERY_BUDGETS:
+            with self.subTest(method=method, route=name, data=data), transaction.atomic():
+                self.assertWithinBudget(method, reverse(name, kwargs=kwargs), data, expected_status,
+                                        max_queries, max_rows)
+                transaction.set_rollback(True)
+
+    def assertWithinBudget(self, method, url, data, expected_status, max_queries, max_rows):
+        # Every connection is logged, so queries routed to another database
+        # (a replica, a shard) count against the budget too.
+        logs = [QueryLog(alias_connection) for alias_connection in connections.all()]
+        with ExitStack() as stack:
+            for log in logs:
+                stack.enter_context(log.connection.execute_wrapper(log))
+            if method == 'GET':
+                response = self.client.get(url, data)
+            else:
+                response = getattr(self.client, method.lower())(url, data, format='json')
+            content = b''.join(response.streaming_content) if response.streaming else response.content
+        self.assertEqual(response.status_code, expected_status, content[:500])
+
+        queries = sum(len(log.queries) for log in logs)
+        rows = sum(log.rows for log in logs)
+        if queries > max_queries or rows > max_rows:
+            report = '\n'.join(log.report() for log in logs if log.queries)
+            self.fail(f'{method} {url} made {queries} queries (budget {max_queries}) '
+                      f'returning {rows} rows (budget {max_rows}):\n{report}')
+
+
+@single_database
+class ImportTransactionsTests(TestCase):
+    rows = [
+        'type,code,date,item,quantity,unit_price,description',
+        'sell,SO001,2025-01-05,ITEM001,12,,Sell',
+        'purchase,PO002,2025-01-03,ITEM001,10,20,Second',
+        'purchase,PO001,2025-01-01,ITEM001,5,10,First',
+        'purchase,PO001,2025-01-01,ITEM002,4,7,First',
+        'sell,SO002,2025-01-06,ITEM002,1,,Sell',
+    ]
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = Path(self.tmp.name) / 'history.csv'
+        self.path.write_text('\n'.join(self.rows) + '\n')
+        Item.objects.create(code='ITEM001', name='Product 1', unit='pcs')
+        Item.objects.create(code='ITEM002', name='Product 2', unit='pcs')
+
+    def assertImported(self):
+        item = Item.objects.get(code='ITEM001')
+        self.assertEqual(item.stock, Decimal('3'))
+        self.assertEqual(item.balance, Decimal('60'))
+        self.assertEqual(
+            list(PurchaseDetail.objects.filter(item=item).order_by('header__date').values_list('remaining_quantity', flat=True)),
+            [Decimal('0'), Decimal('3')],
+        )
+        self.assertEqual(Item.objects.get(code='ITEM002').balance, Decimal('21'))
+        self.assertEqual(SellDetail.objects.count(), 2)
+        self.assertEqual(PurchaseHeader.objects.get(code='PO001').details.count(), 2)
+        self.assertFalse(ImportCheckpoint.objects.exists())
+        call_command('check_ledger', stdout=StringIO())
+
+    def test_import_applies_fifo_in_date_order(self):
+        call_command('import_transactions', str(self.path), batch_size=2, stdout=StringIO())
+        self.assertImported()
+
+    def test_import_resumes_after_checkpoint(self):
+        call_command('import_transactions', str(self.path), batch_size=2, stdout=StringIO())
+        StockMovement.objects.exclude(reference='PO001').delete()
+        SellDetail.objects.all().delete()
+        PurchaseDetail.objects.exclude(header_id='PO001').delete()
+        PurchaseHeader.objects.exclude(code='PO001').delete()
+        SellHeader.objects.all().delete()
+        PurchaseDetail.objects.update(remaining_quantity=F('quantity'))
+        Item.objects.filter(code='ITEM001').update(stock=5, balance=50)
+        Item.objects.filter(code='ITEM002').update(stock=4, balance=28)
+
+        stat = self.path.stat()
+        ImportCheckpoint.objects.create(
+            name=str(self.path.resolve()), files=[[str(self.path.resolve()), stat.st_size, stat.st_mtime_ns]], done=2,
+        )
+        with self.assertRaises(CommandError):
+            call_command('import_transactions', str(self.path), stdout=StringIO())
+
+        call_command('import_transactions', str(self.path), resume=True, stdout=StringIO())
+        self.assertImported()
+
+    def test_checkpoint_commits_with_its_batch(self):
+        import_batch = TransactionImporter.import_batch
+        calls = []
+
+        def crash_on_second_batch(importer, batch):
+            calls.append(batch)
+            import_batch(importer, batch)
+            if len(calls) == 2:
+                raise RuntimeError('crash')
+
+        with patch.object(TransactionImporter, 'import_batch', crash_on_second_batch):
+            with self.assertRaisesMessage(RuntimeError, 'crash'):
+                call_command('import_transactions', str(self.path), batch_size=2, stdout=StringIO())
+        # The second batch was rolled back together with its checkpoint.
+        self.assertEqual(ImportCheckpoint.objects.get().done, 2)
+        self.assertEqual(PurchaseDetail.objects.count(), 2)
+
+        call_command('import_transactions', str(self.path), resume=True, stdout=StringIO())
+        self.assertImported()
+
+    def test_import_reports_bad_lines(self):
+        cases = [
+            ('history.ndjson', '{"type": "purchase"\n', 'history.ndjson:1: invalid JSON'),
+            ('history.ndjson', '["purchase"]\n', 'history.ndjson:1: expected a JSON object.'),
+            ('history.ndjson', '{"type": "purchase", "code": "PO1", "date": "2025-01-01", "item": "ITEM001", '
+                               '"quantity": NaN, "unit_price": 1}\n', 'must be finite numbers.'),
+            ('history.csv', 'type,code,date,item,quantity,unit_price\npurchase,PO1,2025-01-01,ITEM001,Infinity,1\n',
+             'history.csv:2: Quantity and unit price must be finite numbers.'),
+            ('history.ndjson', '{"type": "purchase", "code": "PO1", "date": "2025-01-01", "quantity": 1, '
+                               '"unit_price": 1}\n', "history.ndjson:1: missing or unknown value for 'item'."),
+            ('history.csv', 'type,code,date,item,quantity,unit_price\npurchase, ,2025-01-01,,1,1\n',
+             'history.csv:2: Code and item must not be blank.'),
+        ]
+        for name, content, message in cases:
+            with self.subTest(content=content):
+                path = Path(self.tmp.name) / name
+                path.write_text(content)
+                with self.assertRaisesMessage(CommandError, message):
+                    call_command('import_transactions', str(path), create_items=True, stdout=StringIO())
+        self.assertFalse(Item.objects.filter(code='').exists())
+
+    def test_only_backdated_items_are_recosted(self):
+        self.path.write_text('type,code,date,item,quantity,unit_price\n'
+                             'purchase,PO1,2025-01-01,ITEM001,1,5\n'
+                             'purchase,PO2,2025-01-01,ITEM001,1,6\n'
+                             'purchase,PO3,2025-01-01,ITEM001,1,7\n')
+        with patch.object(TransactionImporter, 'recost') as recost:
+            call_command('import_transactions', str(self.path), batch_size=1, stdout=StringIO())
+        recost.assert_not_called()
+
+        # A purchase dated on the day of an existing sale goes before it.
+        self.path.write_text('type,code,date,item,quantity,unit_price\nsell,SO1,2025-01-02,ITEM001,2,\n')
+        call_command('import_transactions', str(self.path), stdout=StringIO())
+        self.path.write_text('type,code,date,item,quantity,unit_price\npurchase,PO4,2025-01-02,ITEM001,1,1\n')
+        with patch.object(TransactionImporter, 'recost', autospec=True,
+                          side_effect=TransactionImporter.recost) as recost:
+            call_command('import_transactions', str(self.path), stdout=StringIO())
+        self.assertEqual(recost.call_args.args[1], {'ITEM001'})
+        self.assertEqual(Item.objects.get(code='ITEM001').balance, Decimal('8'))
+        call_command('check_ledger', stdout=StringIO())
+
+    def test_import_rejects_a_header_code_with_another_date(self):
+        self.path.write_text('type,code,date,item,quantity,unit_price\n'
+                             'purchase,PO1,2024-01-01,ITEM001,10,5\n'
+                             'purchase,PO1,2024-03-01,ITEM001,10,7\n')
+        for batch_size in (10, 1):
+            with self.subTest(batch_size=batch_size):
+                with self.assertRaisesMessage(CommandError, 'history.csv:3: PO1 '):
+                    call_command('import_transactions', str(self.path), batch_size=batch_size, stdout=StringIO())
+                self.assertLessEqual(PurchaseDetail.objects.filter(header='PO1').count(), 1)
+                call_command('check_ledger', stdout=StringIO())
+                ImportCheckpoint.objects.all().delete()
+
+    def test_import_rejects_oversell(self):
+        self.path.write_text('type,code,date,item,quantity,unit_price\nsell,SO001,2025-01-01,ITEM001,1,\n')
+        with self.assertRaisesMessage(CommandError, 'Insufficient stock available.'):
+            call_command('import_transactions', str(self.path), stdout=StringIO())
+        self.assertFalse(SellHeader.objects.exists())
+
+
+class ExportTests(WarehouseTestCase):
+    dates = 'start_date=2025-01-01&end_date=2025-01-31'
+
+    def content(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_report_json(self):
+        response = self.client.get(f'/api/report/ITEM001/?{self.dates}', HTTP_ACCEPT='application/json')
+        result = response.json()['result']
+        self.assertEqual([entry['code'] for entry in result['items']], ['PO001', 'SO001'])
+        self.assertEqual(result['items'][1]['out_total'], 6)
+        self.assertEqual(result['items'][1]['balance_qty'], 6)
+        self.assertEqual(result['summary'], {'in_qty': 10, 'out_qty': 4, 'balance_qty': 6, 'balance': 9})
+
+    def test_report_csv(self):
+        response = self.client.get(f'/api/report/ITEM001/?{self.dates}&format=csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="report-ITEM001.csv"')
+        rows = list(csv.reader(io.StringIO(self.content(response).decode())))
+        self.assertEqual(rows[0], ENTRY_FIELDS)
+        self.assertEqual(rows[2][:9], ['03-01-2025', 'Sell', 'SO001', '0', '0', '0', '4', '1', '6'])
+        self.assertEqual(rows[-1][1], 'Summary')
+
+    @skipUnless(openpyxl, 'openpyxl is not installed')
+    def test_report_xlsx(self):
+        SellHeader.objects.filter(code='SO001').update(description='Sell\x0b to <A&B>\x00')
+        response = self.client.get(f'/api/report/ITEM001/?{self.dates}&format=xlsx')
+        sheet = openpyxl.load_workbook(io.BytesIO(self.content(response)), read_only=True).active
+        self.assertEqual(sheet.title, 'ITEM001')
+        rows = list(sheet.iter_rows(values_only=True))
+        self.assertEqual(list(rows[0]), ENTRY_FIELDS)
+        self.assertEqual(rows[2][:9], ('03-01-2025', 'Sell to <A&B>', 'SO001', 0, 0, 0, 4, 1, 6))
+        self.assertEqual(len(rows), 4)
+
+    def test_multi_item_report_archive(self):
+        response = self.client.get(f'/api/report/?{self.dates}&format=csv&items=ITEM001,ITEM002')
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        archive = zipfile.ZipFile(io.BytesIO(self.content(response)))
+        self.assertEqual(archive.namelist(), ['report-ITEM001.csv', 'report-ITEM002.csv'])
+        self.assertIn(b'PO001', archive.read('report-ITEM002.csv'))
+
+    def test_failed_export_ends_with_an_error_row(self):
+        def rows():
+            yield ['ITEM001', 1]
+            raise RuntimeError('database went away')
+
+        with self.assertLogs('warehouse.exports', 'ERROR'):
+            lines = list(csv.reader(io.StringIO(b''.join(csv_stream(['code', 'qty'], rows())).decode())))
+        self.assertEqual(lines, [['code', 'qty'], ['ITEM001', '1'], [EXPORT_ERROR]])
+
+        with self.assertLogs('warehouse.exports', 'ERROR'):
+            workbook = zipfile.ZipFile(io.BytesIO(b''.join(xlsx_stream(['code', 'qty'], rows()))))
+        self.assertIn(f'<row r="3"><c r="A3" t="inlineStr"><is><t xml:space="preserve">{EXPORT_ERROR}</t>',
+                      workbook.read('xl/worksheets/sheet1.xml').decode())
+
+        def files():
+            yield 'report-ITEM001.csv', [b'code\r\n']
+            raise RuntimeError('database went away')
+
+        with self.assertLogs('warehouse.exports', 'ERROR'):
+            archive = zipfile.ZipFile(io.BytesIO(b''.join(zip_stream(files()))))
+        self.assertEqual(archive.namelist(), ['report-ITEM001.csv', 'EXPORT-ERROR.txt'])
+
+    def test_xlsx_sheet_name_is_sanitized(self):
+        workbook = zipfile.ZipFile(io.BytesIO(b''.join(xlsx_stream(['code'], [], sheet='A/B:C*D?[E]\\' + 'F' * 40))))
+        self.assertIn('<sheet name="ABCDE' + 'F' * 26 + '"', workbook.read('xl/workbook.xml').decode())
+
+    def test_item_list_csv(self):
+        rows = list(csv.reader(io.StringIO(self.content(self.client.get('/api/items/?format=csv')).decode())))
+        self.assertEqual(rows[0], ['code', 'name', 'unit', 'description', 'stock', 'balance'])
+        self.assertEqual(rows[1][0], 'ITEM001')
+        self.assertEqual(len(rows), 3)
+
+
+class SQLiteBackendTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = str(Path(tmp.name) / 'db.sqlite3')
+        handler = ConnectionHandler({
+            'default': {
+                'ENGINE': 'core.backends.sqlite3',
+                'NAME': self.path,
+                'OPTIONS': {
+                    'transaction_mode': 'IMMEDIATE',
+                    'pragmas': {'journal_mode': 'WAL', 'busy_timeout': 50, 'cache_size': -2000},
+                },
+            }
+        })
+        self.connection = handler['default']
+        self.addCleanup(self.connection.close)
+
+    def test_pragmas_applied_on_connect(self):
+        with self.connection.cursor() as cursor:
+            self.assertEqual(cursor.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            self.assertEqual(cursor.execute('PRAGMA busy_timeout').fetchone()[0], 50)
+            self.assertEqual(cursor.execute('PRAGMA cache_size').fetchone()[0], -2000)
+
+    def test_atomic_takes_write_lock_up_front(self):
+        other = sqlite3.connect(self.path, timeout=0, isolation_level=None)
+        self.addCleanup(other.close)
+
+        # What atomic() does when it opens the outermost transaction.
+        self.connection.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        try:
+            self.assertTrue(self.connection.holds_write_lock)
+            with self.assertRaisesMessage(sqlite3.OperationalError, 'database is locked'):
+                other.execute('BEGIN IMMEDIATE')
+        finally:
+            self.connection.rollback()
+            self.connection.set_autocommit(True)
+        self.assertFalse(self.connection.holds_write_lock)
+        other.execute('BEGIN IMMEDIATE')
+        other.execute('ROLLBACK')
+
+
+# Boots the API-only profile on an in-memory database, serves one request and
+# reports which apps and modules got loaded.
+API_PROFILE_SCRIPT = """
+import json, sys
+from django.conf import settings
+settings.DATABASES['default']['NAME'] = ':memory:'
+import django
+django.setup()
+from django.apps import apps
+from django.core.management import call_command
+from django.test import Client
+from django.test.utils import setup_test_environment
+setup_test_environment()
+call_command('migrate', verbosity=0)
+response = Client().get('/api/items/')
+print(json.dumps({
+    'apps': [config.name for config in apps.get_app_configs()],
+    'status': response.status_code,
+    'content_type': response['Content-Type'],
+    'admin': Client().get('/admin/').status_code,
+    'modules': sorted(sys.modules),
+}))
+"""
+
+
+class ApiProfileTests(SimpleTestCase):
+    def test_serves_the_api_without_contrib_apps(self):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='core.settings_api')
+        output = subprocess.run([sys.executable, '-c', API_PROFILE_SCRIPT], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+
+        self.assertEqual(result['apps'], ['warehouse'])
+        self.assertEqual((result['status'], result['content_type']), (200, 'application/json'))
+        self.assertEqual(result['admin'], 404)
+        for module in ('django.contrib.sessions', 'django.contrib.auth.models', 'django.contrib.staticfiles',
+                       'warehouse.exports', 'warehouse.reports', 'warehouse.search', 'warehouse.analytics',
+                       'warehouse.changes'):
+            self.assertNotIn(module, result['modules'])
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def route_request(self, request):
+        seen = []
+        middleware = ReadYourWritesMiddleware(lambda request: seen.append(self.router.db_for_read(Item)) or HttpResponse())
+        response = middleware(request)
+        return seen[0], response
+
+    def test_reads_go_to_replica_and_writes_to_primary(self):
+        self.assertEqual(self.router.db_for_read(Item), 'replica')
+        self.assertEqual(self.router.db_for_write(Item), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'warehouse'))
+        with pin_to_primary():
+            self.assertEqual(self.router.db_for_read(Item), 'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_uses_primary(self):
+        self.assertEqual(self.router.db_for_read(Item), 'default')
+
+    def test_client_reads_its_writes_within_window(self):
+        alias, response = self.route_request(self.factory.post('/api/items/'))
+        self.assertEqual(alias, 'default')
+        pinned_until = float(response.cookies[PIN_COOKIE].value)
+        self.assertAlmostEqual(pinned_until, time.time() + 5, delta=1)
+
+        request = self.factory.get('/api/items/')
+        request.COOKIES[PIN_COOKIE] = str(pinned_until)
+        self.assertEqual(self.route_request(request)[0], 'default')
+
+        request.COOKIES[PIN_COOKIE] = str(time.time() - 1)
+        self.assertEqual(self.route_request(request)[0], 'replica')
+        self.assertEqual(self.route_request(self.factory.get('/api/items/'))[0], 'replica')
+
+    def test_replica_lags_until_synced(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        handler = ConnectionHandler({
+            alias: {'ENGINE': 'core.backends.sqlite3', 'NAME': str(Path(tmp.name) / f'{alias}.sqlite3')}
+            for alias in ('default', 'replica')
+        })
+        primary, replica = handler['default'], handler['replica']
+        self.addCleanup(handler.close_all)
+
+        with primary.cursor() as cursor:
+            cursor.execute('CREATE TABLE stock (code TEXT)')
+            cursor.execute("INSERT INTO stock VALUES ('ITEM001')")
+        sync_replica(primary, replica)
+        with primary.cursor() as cursor:
+            cursor.execute("INSERT INTO stock VALUES ('ITEM002')")
+
+        with replica.cursor() as cursor:
+            self.assertEqual(cursor.execute('SELECT COUNT(*) FROM stock').fetchone()[0], 1)
+        sync_replica(primary, replica)
+        with replica.cursor() as cursor:
+            self.assertEqual(cursor.execute('SELECT COUNT(*) FROM stock').fetchone()[0], 2)
+
+
+@override_settings(WAREHOUSE_SHARDS=['default', 'shard1'])
+class ShardRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ShardRouter()
+
+    def test_items_and_lines_follow_the_item_code(self):
+        self.assertEqual(shard_for('ITEM001'), 'shard1')
+        self.assertEqual(shard_for('ITEM004'), 'default')
+        self.assertEqual(self.router.db_for_write(Item, instance=Item(code='ITEM001')), 'shard1')
+        self.assertEqual(self.router.db_for_write(PurchaseDetail, instance=PurchaseDetail(item_id='ITEM001')), 'shard1')
+        self.assertEqual(self.router.db_for_read(Item), 'default')
+        with use_shard('shard1'):
+            self.assertEqual(self.router.db_for_read(SellDetail), 'shard1')
+
+    def test_other_apps_stay_on_default(self):
+        # The router only reads the app label, and the auth app is not
+        # installed under every settings profile.
+        user = SimpleNamespace(_meta=SimpleNamespace(app_label='auth'))
+        with use_shard('shard1'):
+            self.assertEqual(self.router.db_for_read(user), 'default')
+        self.assertFalse(self.router.allow_migrate('shard1', 'auth'))
+        self.assertTrue(self.router.allow_migrate('shard1', 'warehouse'))
+
+    def test_merge_keeps_model_ordering(self):
+        rows = merge_sorted([
+            [{'code': 'PO3', 'date': '2025-01-03'}, {'code': 'PO1', 'date': '2025-01-01'}],
+            [{'code': 'PO2', 'date': '2025-01-03'}, {'code': 'PO4', 'date': '2025-01-02'}],
+        ], ['-date', 'code'])
+        self.assertEqual([row['code'] for row in rows], ['PO2', 'PO3', 'PO4', 'PO1'])
+
+
+@skipUnless(len(settings.WAREHOUSE_SHARDS) > 1, 'run with DJANGO_SETTINGS_MODULE=core.settings_sharded')
+class ShardedApiTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.client = APIClient()
+        for code in ('ITEM001', 'ITEM002', 'ITEM004', 'ITEM005'):
+            self.client.post('/api/items/', {'code': code, 'name': code, 'unit': 'pcs'}, format='json')
+        self.client.post('/api/purchase/', {'code': 'PO001', 'date': '2025-01-01'}, format='json')
+        self.client.post('/api/sell/', {'code': 'SO001', 'date': '2025-01-02'}, format='json')
+        for code in ('ITEM001', 'ITEM002'):
+            response = self.client.post('/api/purchase/PO001/add_detail/',
+                                        {'item': code, 'quantity': '5', 'unit_price': '2'}, format='json')
+            self.assertEqual(response.status_code, 201, response.content)
+        response = self.client.post('/api/sell/SO001/add_detail/', {'item': 'ITEM002', 'quantity': '3'}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def test_rows_are_stored_on_the_item_shard(self):
+        for code in ('ITEM001', 'ITEM002', 'ITEM004', 'ITEM005'):
+            alias = shard_for(code)
+            self.assertTrue(Item.objects.using(alias).filter(code=code).exists())
+            self.assertEqual(sum(Item.objects.using(other).filter(code=code).count()
+                                 for other in settings.WAREHOUSE_SHARDS), 1)
+        line = PurchaseDetail.objects.using(shard_for('ITEM002')).get(item='ITEM002')
+        self.assertEqual(line.remaining_quantity, Decimal('2'))
+        self.assertEqual(line.pk // ID_BLOCK, settings.WAREHOUSE_SHARDS.index(shard_for('ITEM002')))
+
+    def test_lists_merge_all_shards(self):
+        items = self.client.get('/api/items/').json()
+        self.assertEqual([item['code'] for item in items], ['ITEM001', 'ITEM002', 'ITEM004', 'ITEM005'])
+        self.assertEqual(self.client.get('/api/items/ITEM002/').json()['stock'], '2.00')
+
+        purchases = self.client.get('/api/purchase/').json()
+        self.assertEqual(len(purchases), 1)
+        self.assertEqual(sorted(line['item'] for line in purchases[0]['details']), ['ITEM001', 'ITEM002'])
+        self.assertEqual(self.client.get('/api/purchase/PO001/').json(), purchases[0])
+        self.assertEqual(self.client.get('/api/purchase/PO001/details/').json(), purchases[0]['details'])
+
+    def test_rejected_line_leaves_no_header_copy(self):
+        alias = shard_for('ITEM004')
+        response = self.client.post('/api/purchase/PO001/add_detail/',
+                                    {'item': 'ITEM004', 'quantity': 'many', 'unit_price': '2'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PurchaseHeader.objects.using(alias).filter(code='PO001').exists())
+        response = self.client.post('/api/purchase/PO001/add_detail/',
+                                    {'item': 'ITEM004', 'quantity': '1', 'unit_price': '2'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(PurchaseHeader.objects.using(alias).filter(code='PO001').exists())
+
+    def test_header_changes_reach_every_copy(self):
+        self.client.patch('/api/purchase/PO001/', {'description': 'Restock'}, format='json')
+        self.assertEqual(self.client.get('/api/purchase/').json()[0]['description'], 'Restock')
+        self.client.delete('/api/purchase/PO001/')
+        self.assertEqual(self.client.get('/api/purchase/').json(), [])
+        for alias in {shard_for('ITEM001'), shard_for('ITEM002')}:
+            self.assertTrue(PurchaseHeader.objects.using(alias).get(code='PO001').is_deleted)
+
+    def test_search_merges_shards(self):
+        response = self.client.get('/api/items/search/', {'q': 'item', 'limit': 3})
+        self.assertEqual([item['code'] for item in response.json()['results']], ['ITEM001', 'ITEM002', 'ITEM004'])
+        self.assertIsNotNone(response.json()['next'])
+
+    def test_report_reads_the_item_shard(self):
+        response = self.client.get('/api/report/ITEM002/', {'start_date': '2025-01-01', 'end_date': '2025-01-31'})
+        self.assertEqual(response.json()['result']['summary']['balance_qty'], 2)
+        response = self.client.get('/api/report/', {'format': 'csv', 'start_date': '2025-01-01', 'end_date': '2025-01-31'})
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertEqual(len(archive.namelist()), 4)
+
+    def test_analytics_combine_shards(self):
+        page = self.client.get('/api/analytics/items/', {'ordering': '-purchased_cost', 'limit': 1}).json()
+        self.assertEqual([row['item'] for row in page['results']], ['ITEM001'])
+        page = self.client.get(page['next']).json()
+        self.assertEqual([(row['item'], row['sold_cost']) for row in page['results']], [('ITEM002', '6.00')])
+
+        months = self.client.get('/api/analytics/monthly/').json()['results']
+        self.assertEqual([(row['month'], row['purchased_cost'], row['sold_cost']) for row in months],
+                         [('2025-01', '20.00', '6.00')])
+        top = self.client.get('/api/analytics/top/', {'by': 'sold_qty', 'top': 1}).json()['results']
+        self.assertEqual([(row['rank'], row['item']) for row in top], [(1, 'ITEM002')])
+
+    def test_change_cursor_has_one_position_per_shard(self):
+        data = self.client.get('/api/changes/').json()
+        self.assertEqual([change['reference'] for change in data['changes']], ['PO001', 'PO001', 'SO001'])
+        positions = data['cursor'].split(',')
+        self.assertEqual(len(positions), len(settings.WAREHOUSE_SHARDS))
+        self.assertEqual(self.client.get('/api/changes/', {'after': data['cursor']}).json()['changes'], [])
+        self.assertEqual(self.client.get('/api/changes/', {'after': '0'}).status_code, 400)
@@ -7,7 +7,10 @@ router.register('items', views.ItemViewSet)
 router.register('purchase', views.PurchaseHeaderViewSet)
 router.register('sell', views.SellHeaderViewSet)
 router.register('report', views.Report, basename='report')
+router.register('analytics', views.Analytics, basename='analytics')
+router.register('changes', views.ChangeFeed, basename='changes')
 
 urlpatterns = [
+    path('changes/stream/', views.change_stream, name='change-stream'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
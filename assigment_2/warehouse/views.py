@@ -1,47 +1,361 @@
+import heapq
+import json
+from contextlib import ExitStack
+from datetime import datetime
+from functools import partial
+from operator import attrgetter, itemgetter
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework.permissions import SAFE_METHODS
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import F
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from core.sharding import current_shard, merge_sorted, shard_aliases, shard_for, shard_querysets, use_shard
 from .models import Item, PurchaseHeader, PurchaseDetail, SellHeader, SellDetail
 from .serializers import (
     ItemSerializer,
     PurchaseHeaderSerializer,
     PurchaseDetailSerializer,
     SellHeaderSerializer,
-    SellDetailSerializer
+    SellDetailSerializer,
+    ItemMovementSerializer,
+    MonthlyMovementSerializer,
+    TopMoverSerializer
 )
-from django.db.models import F, Sum
-from django.utils.timezone import make_aware
-from datetime import datetime
-from decimal import Decimal
+from .conditional import conditional, max_updated_at
+from .encoders import row_encoder
+from .ledger import header_moved, position
+from .renderers import CSVRenderer, XLSXRenderer
+
+# Exports, reports, search, analytics and the change feed are imported by the
+# views that use them, so a worker only pays for them on their first request.
+EXPORT_RENDERERS = [CSVRenderer, XLSXRenderer]
+EXPORT_FORMATS = tuple(renderer.format for renderer in EXPORT_RENDERERS)
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+ANALYTICS_PAGE_SIZE = 50
+ANALYTICS_MAX_PAGE_SIZE = 1000
+
+
+def request_value(request, name):
+    """Read one field of the request body before DRF has parsed it."""
+    body = request.body
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(body or b'{}')
+        except ValueError:
+            return None
+        return data.get(name) if isinstance(data, dict) else None
+    return request.POST.get(name)
+
+
+def query_int(request, name, default, minimum, maximum=None):
+    try:
+        value = int(request.query_params[name])
+    except (KeyError, ValueError):
+        return default
+    if value < minimum:
+        return default
+    return min(value, maximum) if maximum else value
+
+
+def query_date(request, name):
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def parse_as_of(request):
+    return query_date(request, 'as_of')
+
+
+def page_response(request, results, limit, offset, more):
+    url = replace_query_param(request.build_absolute_uri(), 'limit', limit)
+    previous = None
+    if offset > 0:
+        previous = replace_query_param(url, 'offset', offset - limit) if offset > limit else remove_query_param(url, 'offset')
+    return Response({
+        'next': replace_query_param(url, 'offset', offset + limit) if more else None,
+        'previous': previous,
+        'results': results,
+    })
+
+
+def encode_rows(serializer_class, queryset):
+    if getattr(settings, 'WAREHOUSE_FAST_READ', True):
+        return row_encoder(serializer_class).encode(queryset)
+    return serializer_class(queryset, many=True).data
+
+
+class ShardMixin:
+    """
+    With `WAREHOUSE_SHARDS` configured, run a request that belongs to one
+    item or header inside `use_shard()` for its shard. The key comes from
+    the URL, or from the body when creating.
+    """
+
+    def get_shard_key(self, request, kwargs):
+        if self.lookup_field in kwargs:
+            return kwargs[self.lookup_field]
+        if self.action_map.get(request.method.lower()) == 'create':
+            return request_value(request, self.lookup_field)
+        return None
+
+    def dispatch(self, request, *args, **kwargs):
+        if not shard_aliases():
+            return super().dispatch(request, *args, **kwargs)
+        key = self.get_shard_key(request, kwargs)
+        with use_shard(shard_for(key) if key else None):
+            return super().dispatch(request, *args, **kwargs)
+
+
+class FastReadMixin:
+    """
+    Serve `list` from `values_list()` rows through a precompiled row encoder
+    instead of instantiating models and running the serializer per row.
+    The rendered JSON is identical to the serializer output.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        if shard_aliases():
+            serializer_class = self.get_serializer_class()
+            results = [encode_rows(serializer_class, shard) for shard in shard_querysets(queryset)]
+            ordering = queryset.query.order_by or queryset.model._meta.ordering
+            return Response(self.combine_rows(merge_sorted(results, ordering)))
+
+        if not getattr(settings, 'WAREHOUSE_FAST_READ', True) or self.paginator is not None:
+            return super().list(request, *args, **kwargs)
+        return Response(row_encoder(self.get_serializer_class()).encode(queryset))
+
+    def combine_rows(self, rows):
+        return rows
 
 
-class ItemViewSet(viewsets.ModelViewSet):
+class AtomicWriteMixin:
+    """
+    Run each write request in a single transaction. With the production
+    SQLite profile the transaction starts with `BEGIN IMMEDIATE`, so
+    concurrent writers queue for the write lock, and the FIFO read-then-write
+    in `SellDetail.save` cannot interleave with another sale. Error
+    responses roll the transaction back.
+    """
+
+    def write_aliases(self, request):
+        return [current_shard()]
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            return super().dispatch(request, *args, **kwargs)
+        aliases = self.write_aliases(request)
+        with ExitStack() as stack:
+            for alias in aliases:
+                stack.enter_context(transaction.atomic(using=alias))
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code >= 400:
+                for alias in aliases:
+                    transaction.set_rollback(True, using=alias)
+            return response
+
+
+class HeaderShardMixin(ShardMixin):
+    """
+    Headers live on the shard of their code, with a copy on every shard
+    that holds one of their lines. `add_detail` runs on the item's shard and
+    creates the copy there once the line is valid; changes to a header are
+    copied to all shards in one transaction per shard, committed together.
+    """
+
+    def write_aliases(self, request):
+        if not shard_aliases() or self.action_map.get(request.method.lower()) in ('create', 'add_detail'):
+            return super().write_aliases(request)
+        return shard_aliases()
+
+    def get_shard_key(self, request, kwargs):
+        if self.action_map.get(request.method.lower()) == 'add_detail':
+            return request_value(request, 'item')
+        return super().get_shard_key(request, kwargs)
+
+    def get_object(self):
+        if not shard_aliases() or self.action != 'add_detail':
+            return super().get_object()
+        code = self.kwargs[self.lookup_field]
+        return get_object_or_404(self.get_queryset().using(shard_for(code)), code=code)
+
+    def shard_copy(self, header):
+        """The copy of `header` on the current shard, created on first use."""
+        alias = current_shard()
+        if not shard_aliases() or header._state.db == alias:
+            return header
+        model = type(header)
+        with transaction.atomic(using=alias):
+            copy = model.objects.using(alias).filter(code=header.code).first()
+            if copy is None:
+                copy = model.objects.using(alias).create(code=header.code, date=header.date,
+                                                          description=header.description)
+        return copy
+
+    def retrieve(self, request, *args, **kwargs):
+        if not shard_aliases():
+            return super().retrieve(request, *args, **kwargs)
+        code = self.kwargs[self.lookup_field]
+        get_object_or_404(self.get_queryset().using(shard_for(code)), code=code)
+        queryset = self.get_queryset().filter(code=code)
+        results = [encode_rows(self.get_serializer_class(), shard) for shard in shard_querysets(queryset)]
+        return Response(self.combine_rows(merge_sorted(results, ['code']))[0])
+
+    def combine_rows(self, rows):
+        combined = []
+        for row in rows:
+            if combined and combined[-1]['code'] == row['code']:
+                combined[-1]['details'] = sorted(combined[-1]['details'] + row['details'], key=itemgetter('id'))
+            else:
+                combined.append(row)
+        return combined
+
+    def detail_rows(self, serializer_class, details):
+        if not shard_aliases():
+            return encode_rows(serializer_class, details)
+        results = [encode_rows(serializer_class, shard) for shard in shard_querysets(details.order_by('pk'))]
+        return merge_sorted(results, ['id'])
+
+    def copy_to_shards(self, header, fields):
+        for alias in shard_aliases():
+            if alias != header._state.db:
+                type(header).objects.using(alias).filter(code=header.code).update(
+                    updated_at=header.updated_at, **{field: getattr(header, field) for field in fields}
+                )
+
+    def perform_update(self, serializer):
+        old_date = serializer.instance.date
+        header = serializer.save()
+        self.copy_to_shards(header, ['date', 'description'])
+        if header.date != old_date:
+            try:
+                header_moved(header, old_date)
+            except DjangoValidationError as e:
+                raise ValidationError({'date': e.messages})
+        # The header date and description appear in the stock cards of its items.
+        details = header.details.model.objects.filter(header=header)
+        for shard in shard_querysets(Item.objects.all()):
+            shard.filter(pk__in=details.using(shard.db).values('item')).update(version=F('version') + 1)
+
+    def perform_destroy(self, instance):
+        instance.is_deleted = True
+        instance.save()
+        self.copy_to_shards(instance, ['is_deleted'])
+
+
+class ItemViewSet(ShardMixin, AtomicWriteMixin, FastReadMixin, viewsets.ModelViewSet):
     queryset = Item.objects.filter(is_deleted=False)
     serializer_class = ItemSerializer
     lookup_field = 'code'
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + EXPORT_RENDERERS
+
+    def list(self, request, *args, **kwargs):
+        # Soft deletes bump `updated_at` as well, so take the maximum over all
+        # rows rather than only the listed ones.
+        last_modified = max_updated_at(Item.objects.all())
+        return conditional(request, [last_modified], partial(self.list_response, request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        version = self.get_queryset().filter(code=kwargs['code']).values_list('updated_at', 'version').first()
+        if version is None:
+            return super().retrieve(request, *args, **kwargs)
+        return conditional(request, version, partial(self.retrieve_response, request, *args, **kwargs))
+
+    def retrieve_response(self, request, *args, **kwargs):
+        try:
+            as_of = parse_as_of(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        instance = self.get_object()
+        serializer = self.get_serializer(instance)
+        data = serializer.data
+        if as_of is not None:
+            stock, balance = position(instance, as_of)
+            data.update(
+                stock=serializer.fields['stock'].to_representation(stock),
+                balance=serializer.fields['balance'].to_representation(balance),
+                as_of=as_of.isoformat(),
+            )
+        return Response(data)
+
+    @action(detail=True, methods=['get'], renderer_classes=api_settings.DEFAULT_RENDERER_CLASSES)
+    def valuation(self, request, code=None):
+        try:
+            as_of = parse_as_of(request) or timezone.localdate()
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        item = self.get_object()
+        stock, balance = position(item, as_of)
+        field = self.get_serializer().fields['balance']
+        return Response({
+            'item_code': item.code,
+            'as_of': as_of.isoformat(),
+            'stock': field.to_representation(stock),
+            'balance': field.to_representation(balance),
+            'unit_cost': field.to_representation(balance / stock if stock else 0),
+        })
+
+    def list_response(self, request, *args, **kwargs):
+        export_format = request.accepted_renderer.format
+        if export_format in EXPORT_FORMATS:
+            from . import exports
+
+            fields = ItemSerializer.Meta.fields
+            queryset = self.filter_queryset(self.get_queryset()).values_list(*fields)
+            rows = heapq.merge(*(shard.iterator(chunk_size=2000) for shard in shard_querysets(queryset)),
+                               key=itemgetter(0))
+            chunks = exports.export_stream(export_format, fields, rows, sheet='Items')
+            return exports.streaming_response(chunks, f'items.{export_format}', export_format)
+        return super().list(request, *args, **kwargs)
 
     def perform_destroy(self, instance):
         instance.is_deleted = True
         instance.save()
 
+    @action(detail=False, methods=['get'], renderer_classes=api_settings.DEFAULT_RENDERER_CLASSES)
+    def search(self, request):
+        from . import search
+
+        limit = query_int(request, 'limit', SEARCH_PAGE_SIZE, 1, SEARCH_MAX_PAGE_SIZE)
+        offset = query_int(request, 'offset', 0, 0)
+        hits, more = search.search(request.query_params.get('q', ''), limit, offset)
+
+        rows = {}
+        for alias in {alias for alias, _ in hits}:
+            codes = [code for hit_alias, code in hits if hit_alias == alias]
+            for row in encode_rows(ItemSerializer, Item.objects.using(alias).filter(code__in=codes)):
+                rows[row['code']] = row
+
+        return page_response(request, [rows[code] for _, code in hits if code in rows], limit, offset, more)
 
-class PurchaseHeaderViewSet(viewsets.ModelViewSet):
+
+class PurchaseHeaderViewSet(HeaderShardMixin, AtomicWriteMixin, FastReadMixin, viewsets.ModelViewSet):
     queryset = PurchaseHeader.objects.filter(is_deleted=False)
     serializer_class = PurchaseHeaderSerializer
     lookup_field = 'code'
 
-    def perform_destroy(self, instance):
-        instance.is_deleted = True
-        instance.save()
-
     @action(detail=True, methods=['post'])
     def add_detail(self, request, code=None):
         header = self.get_object()
         serializer = PurchaseDetailSerializer(data=request.data)
         
         if serializer.is_valid():
-            serializer.save(header=header)
+            try:
+                serializer.save(header=self.shard_copy(header))
+            except DjangoValidationError as e:
+                return Response({'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -49,26 +363,24 @@ class PurchaseHeaderViewSet(viewsets.ModelViewSet):
     def details(self, request, code=None):
         header = self.get_object()
         details = PurchaseDetail.objects.filter(header=header, is_deleted=False)
-        serializer = PurchaseDetailSerializer(details, many=True)
-        return Response(serializer.data)
+        return Response(self.detail_rows(PurchaseDetailSerializer, details))
 
 
-class SellHeaderViewSet(viewsets.ModelViewSet):
+class SellHeaderViewSet(HeaderShardMixin, AtomicWriteMixin, FastReadMixin, viewsets.ModelViewSet):
     queryset = SellHeader.objects.filter(is_deleted=False)
     serializer_class = SellHeaderSerializer
     lookup_field = 'code'
 
-    def perform_destroy(self, instance):
-        instance.is_deleted = True
-        instance.save()
-
     @action(detail=True, methods=['post'])
     def add_detail(self, request, code=None):
         header = self.get_object()
         serializer = SellDetailSerializer(data=request.data)
         
         if serializer.is_valid():
-            serializer.save(header=header)
+            try:
+                serializer.save(header=self.shard_copy(header))
+            except DjangoValidationError as e:
+                return Response({'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -76,166 +388,162 @@ class SellHeaderViewSet(viewsets.ModelViewSet):
     def details(self, request, code=None):
         header = self.get_object()
         details = SellDetail.objects.filter(header=header, is_deleted=False)
-        serializer = SellDetailSerializer(details, many=True)
-        return Response(serializer.data)
+        return Response(self.detail_rows(SellDetailSerializer, details))
 
 
-class Report(viewsets.ViewSet):
+class Report(ShardMixin, viewsets.ViewSet):
     lookup_field = 'code'
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + EXPORT_RENDERERS
+
+    def list(self, request):
+        from . import exports, reports
+
+        export_format = request.accepted_renderer.format
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'error': 'Use /report/<code>/ for a single item, or format=csv|xlsx to export many items.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            start_date = reports.parse_date(request.query_params.get('start_date'))
+            end_date = reports.parse_date(request.query_params.get('end_date'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        items = Item.objects.filter(is_deleted=False)
+        codes = request.query_params.get('items')
+        if codes:
+            items = items.filter(code__in=[code.strip() for code in codes.split(',') if code.strip()])
+
+        files = (
+            (f'report-{item.code}.{export_format}',
+             exports.export_stream(export_format, reports.ENTRY_FIELDS,
+                                   reports.StockCard(item, start_date, end_date).rows(), sheet=item.code))
+            for item in heapq.merge(*(shard.iterator() for shard in shard_querysets(items)), key=attrgetter('code'))
+        )
+        return exports.streaming_response(exports.zip_stream(files), 'reports.zip', 'zip')
 
     def retrieve(self, request, code=None):
+        # The item version changes with every stock movement of the item, so
+        # a matching ETag skips the FIFO replay entirely.
+        version = Item.objects.filter(code=code, is_deleted=False).values_list('version', 'updated_at').first()
+        if version is None:
+            return self.stock_card(request, code)
+        return conditional(request, version, partial(self.stock_card, request, code))
+
+    def stock_card(self, request, code):
+        from . import exports, reports
+
         try:
             item = get_object_or_404(Item, code=code, is_deleted=False)
-            start_date = request.query_params.get('start_date')
-            end_date = request.query_params.get('end_date')
-
-            if start_date:
-                start_date = make_aware(datetime.strptime(start_date, '%Y-%m-%d'))
-            if end_date:
-                end_date = make_aware(datetime.strptime(end_date, '%Y-%m-%d'))
-
-            # Get all purchase and sell details for the item with date filtering
-            purchases = PurchaseDetail.objects.filter(
-                item=item,
-                is_deleted=False,
-                header__date__range=(start_date, end_date) if start_date and end_date else (None, None)
-            ).select_related('header')
-            
-            sells = SellDetail.objects.filter(
-                item=item,
-                is_deleted=False,
-                header__date__range=(start_date, end_date) if start_date and end_date else (None, None)
-            ).select_related('header')
-            
-            # Combine and sort all transactions by date
-            transactions = []
-            
-            for purchase in purchases:
-                transactions.append({
-                    'date': purchase.header.date,
-                    'description': purchase.header.description or '',
-                    'code': purchase.header.code,
-                    'type': 'purchase',
-                    'quantity': purchase.quantity,
-                    'unit_price': purchase.unit_price,
-                    'remaining_quantity': purchase.remaining_quantity
-                })
-            
-            for sell in sells:
-                transactions.append({
-                    'date': sell.header.date,
-                    'description': sell.header.description or '',
-                    'code': sell.header.code,
-                    'type': 'sell',
-                    'quantity': sell.quantity
-                })
-            
-            # Sort transactions by date
-            transactions.sort(key=lambda x: x['date'])
-            
-            # Process transactions to build the report
-            result = []
-            running_stock = []
-            total_in_qty = Decimal('0')
-            total_out_qty = Decimal('0')
-            
-            for trans in transactions:
-                if trans['type'] == 'purchase':
-                    # Handle purchase transaction
-                    stock_entry = {
-                        'quantity': trans['quantity'],
-                        'price': trans['unit_price'],
-                        'remaining': trans['remaining_quantity']
-                    }
-                    running_stock.append(stock_entry)
-                    
-                    # Calculate current stock quantities and totals
-                    stock_qty = [entry['remaining'] for entry in running_stock]
-                    stock_price = [entry['price'] for entry in running_stock]
-                    stock_total = [qty * price for qty, price in zip(stock_qty, stock_price)]
-                    
-                    entry = {
-                        'date': trans['date'].strftime('%d-%m-%Y'),
-                        'description': trans['description'],
-                        'code': trans['code'],
-                        'in_qty': int(trans['quantity']),
-                        'in_price': int(trans['unit_price']),
-                        'in_total': int(trans['quantity'] * trans['unit_price']),
-                        'out_qty': 0,
-                        'out_price': 0,
-                        'out_total': 0,
-                        'stock_qty': [int(qty) for qty in stock_qty],
-                        'stock_price': [int(price) for price in stock_price],
-                        'stock_total': [int(total) for total in stock_total],
-                        'balance_qty': int(sum(stock_qty)),
-                        'balance': int(sum(stock_total))
-                    }
-                    
-                    total_in_qty += trans['quantity']
-                    
-                else:  # sell transaction
-                    out_qty = trans['quantity']
-                    out_total = Decimal('0')
-                    out_price = Decimal('0')
-                    
-                    # Process FIFO for selling
-                    remaining_to_sell = out_qty
-                    for stock in running_stock:
-                        if remaining_to_sell <= 0:
-                            break
-                            
-                        available = stock['remaining']
-                        if available > 0:
-                            sold = min(remaining_to_sell, available)
-                            stock['remaining'] -= sold
-                            out_total += sold * stock['price']
-                            remaining_to_sell -= sold
-                    
-                    if out_qty > 0:
-                        out_price = out_total / out_qty
-                    
-                    # Calculate current stock quantities and totals
-                    stock_qty = [entry['remaining'] for entry in running_stock]
-                    stock_price = [entry['price'] for entry in running_stock]
-                    stock_total = [qty * price for qty, price in zip(stock_qty, stock_price)]
-                    
-                    entry = {
-                        'date': trans['date'].strftime('%d-%m-%Y'),
-                        'description': trans['description'],
-                        'code': trans['code'],
-                        'in_qty': 0,
-                        'in_price': 0,
-                        'in_total': 0,
-                        'out_qty': int(out_qty),
-                        'out_price': int(out_price),
-                        'out_total': int(out_total),
-                        'stock_qty': [int(qty) for qty in stock_qty],
-                        'stock_price': [int(price) for price in stock_price],
-                        'stock_total': [int(total) for total in stock_total],
-                        'balance_qty': int(sum(stock_qty)),
-                        'balance': int(sum(stock_total))
-                    }
-                    
-                    total_out_qty += out_qty
-                
-                result.append(entry)
-            
-            response_data = {
-                'result': {
-                    'items': result,
-                    'item_code': item.code,
-                    'name': item.name,
-                    'unit': item.unit,
-                    'summary': {
-                        'in_qty': int(total_in_qty),
-                        'out_qty': int(total_out_qty),
-                        'balance_qty': int(total_in_qty - total_out_qty),
-                        'balance': int(sum(entry['remaining'] * entry['price'] for entry in running_stock))
-                    }
-                }
-            }
-
-            return Response(response_data)
+            start_date = reports.parse_date(request.query_params.get('start_date'))
+            end_date = reports.parse_date(request.query_params.get('end_date'))
+            card = reports.StockCard(item, start_date, end_date)
+
+            export_format = request.accepted_renderer.format
+            if export_format in EXPORT_FORMATS:
+                chunks = exports.export_stream(export_format, reports.ENTRY_FIELDS, card.rows(), sheet=item.code)
+                return exports.streaming_response(chunks, f'report-{item.code}.{export_format}', export_format)
+
+            return Response({'result': card.as_dict()})
 
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class Analytics(viewsets.ViewSet):
+    """
+    Purchase and sell totals per item, per month and the top items of every
+    month, computed in SQL from the movement ledger (warehouse/analytics.py).
+    All take `start_date`, `end_date`, `items` and `limit`/`offset`.
+    """
+
+    def get_filters(self, request):
+        codes = request.query_params.get('items')
+        return {
+            'start_date': query_date(request, 'start_date'),
+            'end_date': query_date(request, 'end_date'),
+            'items': [code.strip() for code in codes.split(',') if code.strip()] if codes else None,
+        }
+
+    def page(self, request, fetch, serializer_class):
+        limit = query_int(request, 'limit', ANALYTICS_PAGE_SIZE, 1, ANALYTICS_MAX_PAGE_SIZE)
+        offset = query_int(request, 'offset', 0, 0)
+        try:
+            rows = fetch(self.get_filters(request), limit, offset)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        results = serializer_class(rows[:limit], many=True).data
+        return page_response(request, results, limit, offset, len(rows) > limit)
+
+    @action(detail=False, methods=['get'])
+    def items(self, request):
+        from . import analytics
+
+        ordering = request.query_params.get('ordering', '-sold_cost')
+        if ordering.lstrip('-') not in analytics.ITEM_ORDERING:
+            return Response({'error': f'ordering must be one of {", ".join(analytics.ITEM_ORDERING)}.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        def fetch(filters, limit, offset):
+            rows = analytics.fetch_items(analytics.item_totals(**filters, ordering=ordering), limit, offset, ordering)
+            analytics.add_turnover(rows[:limit], filters['start_date'], filters['end_date'])
+            return rows
+        return self.page(request, fetch, ItemMovementSerializer)
+
+    @action(detail=False, methods=['get'])
+    def monthly(self, request):
+        from . import analytics
+
+        def fetch(filters, limit, offset):
+            return analytics.fetch_months(analytics.monthly_totals(**filters), limit, offset)
+        return self.page(request, fetch, MonthlyMovementSerializer)
+
+    @action(detail=False, methods=['get'])
+    def top(self, request):
+        from . import analytics
+
+        by = request.query_params.get('by', 'sold_qty')
+        if by not in analytics.TOTALS:
+            return Response({'error': f'by must be one of {", ".join(analytics.TOTALS)}.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        top = query_int(request, 'top', 10, 1, 100)
+
+        def fetch(filters, limit, offset):
+            return analytics.fetch_top(analytics.top_items(**filters, by=by, top=top), limit, offset, by, top)
+        return self.page(request, fetch, TopMoverSerializer)
+
+
+class ChangeFeed(viewsets.ViewSet):
+    """
+    Batched read of the change log after `?after=<cursor>`. With `?wait=`
+    seconds the request is held until a change arrives (long-poll), see
+    `warehouse.changes.max_wait`.
+    """
+
+    def list(self, request):
+        from . import changes
+
+        try:
+            positions = changes.parse_cursor(request.query_params.get('after'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        limit = query_int(request, 'limit', changes.BATCH_SIZE, 1, changes.MAX_BATCH_SIZE)
+        wait = query_int(request, 'wait', 0, 0, changes.max_wait(request._request))
+
+        entries, more = changes.poll(positions, limit, wait)
+        for index, change in entries:
+            positions[index] = change['id']
+        return Response({
+            'changes': [change for _, change in entries],
+            'cursor': changes.format_cursor(positions),
+            'more': more,
+        })
+
+
+async def change_stream(request):
+    """Server-sent events of the change log, see `warehouse.changes.stream`."""
+    from . import changes
+
+    return await changes.stream(request)